@@ -1,40 +1,24 @@
 import os
-import base64
 import streamlit as st
 import pandas as pd
-import shutil
-
-# Function to clear all previous data
-def clear_all_data():
-    """Clear all data from previous sessions"""
-    try:
-        # List of directories to clear
-        dirs_to_clear = [
-            "input",
-            "output", 
-            "Analyzed Results"
-        ]
-
-        for directory in dirs_to_clear:
-            if os.path.exists(directory):
-                shutil.rmtree(directory)
-
-        # Remove temp attendance file if exists
-        if os.path.exists("temp_attendance.xlsx"):
-            os.remove("temp_attendance.xlsx")
-            
-        return True
-    except Exception as e:
-        st.error(f"Error clearing previous data: {e}")
-        return False
+import payment_store
+import conversion_jobs
+import metrics
+import payment_warehouse
+import pdf_viewer
+import attendance_loader
+import incremental_reconciliation
+import result_sink
+import workspaces
+from attendance_index import AttendanceIndex, file_hash
 
 # Function to initialize directories
-def initialize_directories():
-    """Create all necessary directories"""
+def initialize_directories(workspace):
+    """Create all necessary directories inside the session's workspace"""
     # Main directories
-    INPUT_DIR = "input"
-    OUTPUT_DIR = "output"
-    OUTPUT_ANALYZED_RESULTS = "Analyzed Results"
+    INPUT_DIR = os.path.join(workspace, "input")
+    OUTPUT_DIR = os.path.join(workspace, "output")
+    OUTPUT_ANALYZED_RESULTS = os.path.join(workspace, "Analyzed Results")
     
     # Create main directories
     os.makedirs(INPUT_DIR, exist_ok=True)
@@ -42,11 +26,11 @@ def initialize_directories():
     os.makedirs(OUTPUT_ANALYZED_RESULTS, exist_ok=True)
 
     # Create subdirectories
-    OUTPUT_ANALYZED_ATTANDACE = "Analyzed Results/Attendance_comparison"
-    OUTPUT_ANALYZED_BRANCH = "Analyzed Results/Branch_Names"
-    OUTPUT_ANALYZED_FILTER = "Analyzed Results/Filter_Cases_with_Branch_names"
-    OUTPUT_ANALYZED_MISSING = "Analyzed Results/Missing_cases"
-    OUTPUT_ANALYZED_LESS_PAID = "Analyzed Results/Less_Paid"
+    OUTPUT_ANALYZED_ATTANDACE = os.path.join(OUTPUT_ANALYZED_RESULTS, "Attendance_comparison")
+    OUTPUT_ANALYZED_BRANCH = os.path.join(OUTPUT_ANALYZED_RESULTS, "Branch_Names")
+    OUTPUT_ANALYZED_FILTER = os.path.join(OUTPUT_ANALYZED_RESULTS, "Filter_Cases_with_Branch_names")
+    OUTPUT_ANALYZED_MISSING = os.path.join(OUTPUT_ANALYZED_RESULTS, "Missing_cases")
+    OUTPUT_ANALYZED_LESS_PAID = os.path.join(OUTPUT_ANALYZED_RESULTS, "Less_Paid")
     
     os.makedirs(OUTPUT_ANALYZED_ATTANDACE, exist_ok=True)
     os.makedirs(OUTPUT_ANALYZED_BRANCH, exist_ok=True)
@@ -65,25 +49,21 @@ def initialize_directories():
         'OUTPUT_ANALYZED_LESS_PAID': OUTPUT_ANALYZED_LESS_PAID
     }
 
-# Initialize session state for new session detection
-if 'session_initialized' not in st.session_state:
-    st.session_state.session_initialized = False
-
-# Check if this is a new session
-if not st.session_state.session_initialized:
-    # # Clear all previous data at the start of new session
-    # with st.spinner("🧹 Initializing new session... Clearing previous data..."):
-    clear_all_data()
-        # st.success("✅ Previous session data cleared successfully!")
-        
-    # Mark session as initialized
-    st.session_state.session_initialized = True
-    
-    # # Show session info
-    # st.info("🔄 **New Session Started** - All previous data has been cleared.")
+# Each session works in its own workspace directory, so concurrent users never
+# share or wipe each other's files; the janitor removes idle workspaces
+workspaces.start_janitor()
+if 'workspace' not in st.session_state or not workspaces.exists(st.session_state.workspace):
+    # New session, or this session's workspace expired while it was idle
+    if 'workspace' in st.session_state:
+        for key in ('provider_frames', 'upload_hashes', 'analysis_sink', 'result_workbook', 'converted_workbook',
+                    'compare_metrics', 'reconciliation_state'):
+            st.session_state.pop(key, None)
+    st.session_state.workspace = workspaces.create_workspace()
+WORKSPACE = st.session_state.workspace
+workspaces.touch(WORKSPACE)
 
 # Initialize directories
-dirs = initialize_directories()
+dirs = initialize_directories(WORKSPACE)
 INPUT_DIR = dirs['INPUT_DIR']
 OUTPUT_DIR = dirs['OUTPUT_DIR']
 OUTPUT_ANALYZED_RESULTS = dirs['OUTPUT_ANALYZED_RESULTS']
@@ -93,6 +73,57 @@ OUTPUT_ANALYZED_FILTER = dirs['OUTPUT_ANALYZED_FILTER']
 OUTPUT_ANALYZED_MISSING = dirs['OUTPUT_ANALYZED_MISSING']
 OUTPUT_ANALYZED_LESS_PAID = dirs['OUTPUT_ANALYZED_LESS_PAID']
 
+# Provider frames returned by the last in-process conversion; used instead of
+# re-reading the store for the providers it just wrote
+if 'provider_frames' not in st.session_state:
+    st.session_state.provider_frames = {}
+
+# Uploads are processed straight from memory: the UploadedFile objects are
+# passed down as they are, and the PDF engines read their bytes through
+# getvalue(), which shares the upload's buffer instead of copying it. Only
+# each upload's hash is kept per uploader file id, so reruns do not re-hash
+# it; writing the uploads to the workspace is optional.
+PERSIST_UPLOADS = os.environ.get("CARETAKER_PERSIST_UPLOADS", "0") != "0"
+if 'upload_digests' not in st.session_state:
+    st.session_state.upload_digests = {}
+# Hash of the bytes last written to each upload path, so reruns only write
+# files whose content changed
+if 'upload_hashes' not in st.session_state:
+    st.session_state.upload_hashes = {}
+
+def upload_digest(uploaded_file):
+    """Hash of an uploaded file, computed once per upload"""
+    file_id = getattr(uploaded_file, 'file_id', None) or uploaded_file.name
+    if file_id not in st.session_state.upload_digests:
+        st.session_state.upload_digests[file_id] = file_hash(uploaded_file.getvalue())
+    return st.session_state.upload_digests[file_id]
+
+def save_upload(uploaded_file, digest, file_path):
+    """Write an upload to disk only when its bytes changed"""
+    if st.session_state.upload_hashes.get(file_path) != digest or not os.path.exists(file_path):
+        with open(file_path, "wb") as f:
+            f.write(uploaded_file.getvalue())
+        st.session_state.upload_hashes[file_path] = digest
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def load_attendance_index(attendance_hash, _attendance_file):
+    """Build the attendance index once per distinct attendance file; the
+    normalized table is also kept in a Parquet sidecar across restarts"""
+    return AttendanceIndex.from_excel(_attendance_file, attendance_hash)
+
+# Cached reader of the converted data. The partition signature (part file
+# names, sizes and mtimes) is part of the cache key, so a conversion that
+# rewrites a provider invalidates its entries.
+@st.cache_data(show_spinner=False, max_entries=32)
+def read_converted(provider, output_dir, signature):
+    return payment_store.read_provider(provider, output_dir=output_dir)
+
+def load_provider_frame(provider):
+    """Return a provider's converted rows, from the last conversion if possible"""
+    if provider in st.session_state.provider_frames:
+        return st.session_state.provider_frames[provider]
+    return read_converted(provider, OUTPUT_DIR, payment_store.partition_signature(provider, OUTPUT_DIR))
+
 st.title("Care Taker Data Analysis")
 
 # # Session Status Info
@@ -104,311 +135,370 @@ st.title("Care Taker Data Analysis")
 # File Upload Section
 st.header("📁 File Upload Section")
 
+persist_uploads = st.checkbox("Also save uploaded files to disk", value=PERSIST_UPLOADS,
+                              help="Uploads are processed in memory; enable to keep a copy in this session's workspace")
 col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("Upload PDF Files")
     # File uploader for PDFs
     uploaded_files = st.file_uploader("Upload your PDF files", type="pdf", accept_multiple_files=True)
+    # {file name: (UploadedFile, hash)} of the current uploads
+    pdf_uploads = {}
     if uploaded_files:
         for uploaded_file in uploaded_files:
-            file_path = os.path.join(INPUT_DIR, uploaded_file.name)
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-        st.success(f"Uploaded {len(uploaded_files)} PDF(s) to the **input** directory!")
+            pdf_uploads[uploaded_file.name] = (uploaded_file, upload_digest(uploaded_file))
+            if persist_uploads:
+                save_upload(*pdf_uploads[uploaded_file.name], os.path.join(INPUT_DIR, uploaded_file.name))
+        where = " to the **input** directory" if persist_uploads else ""
+        st.success(f"Uploaded {len(uploaded_files)} PDF(s){where}!")
 
 with col2:
     st.subheader("Upload Attendance Data")
     # File uploader for attendance data
     attendance_file = st.file_uploader("Upload Attendance Excel File", type="xlsx", key="attendance_upload")
-    attendance_file_path = None
+    attendance_data = None
+    attendance_hash = None
     if attendance_file:
-        attendance_file_path = os.path.join("temp_attendance.xlsx")
-        with open(attendance_file_path, "wb") as f:
-            f.write(attendance_file.getbuffer())
+        attendance_data, attendance_hash = attendance_file, upload_digest(attendance_file)
+        if persist_uploads:
+            save_upload(attendance_data, attendance_hash, os.path.join(WORKSPACE, "attendance.xlsx"))
         st.success("Attendance file uploaded successfully!")
+        # Keep every month's attendance in the payment history
+        try:
+            if not payment_warehouse.has_attendance(attendance_hash):
+                attendance_period = attendance_loader.report_period(attendance_data)
+                if attendance_period is None:
+                    st.warning("⚠️ Could not tell which month this export covers; it was not added to the payment history.")
+                else:
+                    attendance_index = load_attendance_index(attendance_hash, attendance_data)
+                    payment_warehouse.add_attendance(attendance_index.df, attendance_period, attendance_hash)
+                    st.info(f"🗄️ Added {attendance_period} attendance to the payment history")
+        except Exception as e:
+            st.warning(f"⚠️ Attendance was not added to the payment history: {e}")
+
+# Drop hashes of files no longer in either uploader
+current_ids = {getattr(f, 'file_id', None) or f.name for f in (uploaded_files or []) + ([attendance_file] if attendance_file else [])}
+for file_id in list(st.session_state.upload_digests):
+    if file_id not in current_ids:
+        del st.session_state.upload_digests[file_id]
 
 # View Uploaded Files Section
 with st.expander("📄 View Uploaded PDFs"):
-    pdf_files = [f for f in os.listdir(INPUT_DIR) if f.lower().endswith(".pdf")] if os.path.exists(INPUT_DIR) else []
-    if pdf_files:
-        selected_pdf = st.selectbox("Select a PDF to view", pdf_files)
+    if pdf_uploads:
+        selected_pdf = st.selectbox("Select a PDF to view", list(pdf_uploads))
         if selected_pdf:
-            pdf_path = os.path.join(INPUT_DIR, selected_pdf)
-            with open(pdf_path, "rb") as f:
-                base64_pdf = base64.b64encode(f.read()).decode("utf-8")
-                pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="700" height="900" type="application/pdf"></iframe>'
-                st.markdown(pdf_display, unsafe_allow_html=True)
+            # Render only the pages being looked at; PNGs are cached per (file, page, zoom)
+            pdf_path, pdf_hash = pdf_uploads[selected_pdf]
+            total_pages = pdf_viewer.page_count(pdf_path)
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                page_number = st.number_input("Page", min_value=1, max_value=total_pages, value=1, step=1,
+                                              key=f"viewer_page_{selected_pdf}")
+            with col2:
+                pages_shown = st.selectbox("Pages per view", [1, 2, 5], key="viewer_pages_shown")
+            with col3:
+                zoom = st.select_slider("Zoom", options=[0.75, 1.0, 1.5, 2.0], value=1.0, key="viewer_zoom")
+            start = int(page_number) - 1
+            stop = min(start + pages_shown, total_pages)
+            st.caption(f"Pages {start + 1}-{stop} of {total_pages}")
+            for offset, image in enumerate(pdf_viewer.render_pages(pdf_path, pdf_hash, start, stop, zoom)):
+                st.image(image, caption=f"Page {start + offset + 1}")
     else:
         st.info("No PDF files found.")
 
 # Process PDFs Section
+# Conversion runs on the session's background job runner; the progress panel
+# below refreshes itself while the job runs, so the rest of the page stays usable
+if 'job_runner' not in st.session_state:
+    st.session_state.job_runner = conversion_jobs.JobRunner()
+job_runner = st.session_state.job_runner
+
 st.header("🔄 Process PDFs")
-if st.button("Process PDFs", type="primary"):
-    with st.spinner("Processing PDFs..."):
-        os.system("python pdf_converter.py")
-    st.success("PDFs have been processed!")
+if st.button("Process PDFs", type="primary", disabled=job_runner.active()):
+    if pdf_uploads:
+        sources = {name: uploaded_file for name, (uploaded_file, _) in pdf_uploads.items()}
+        job_runner.submit(conversion_jobs.ConversionJob(INPUT_DIR, OUTPUT_DIR, warehouse_path=payment_warehouse.warehouse_path,
+                                                        workspace=WORKSPACE, sources=sources))
+    else:
+        st.error("Please upload PDF files first!")
+
+def show_conversion_job():
+    """Progress, cancel button and outcome of the session's latest conversion"""
+    job = job_runner.latest()
+    if job is None:
+        return
+    snapshot = job.snapshot()
+    progress = snapshot['progress']
+    if job.active:
+        if progress['file']:
+            where = f"page {progress['page']}/{progress['pages']}" if progress['pages'] else "from cache"
+            text = (f"File {progress['file_index']}/{progress['files']}: {progress['file']} ({where}) - "
+                    f"{progress['rows']} rows parsed, {progress['fallback']} fallback hits")
+        else:
+            text = "Starting conversion..."
+        st.progress(job.fraction(), text=text)
+        if st.button("Cancel processing"):
+            job.cancel()
+        return
+    # Finished: hand the frames to the rest of the app once, then rerun it
+    if not job.applied:
+        job.applied = True
+        if snapshot['status'] == "done":
+            st.session_state.provider_frames.update(job.provider_frames)
+        st.rerun()
+    if snapshot['status'] == "cancelled":
+        st.warning("⚠️ PDF processing was cancelled; nothing was saved.")
+    elif snapshot['status'] == "failed":
+        st.error(f"❌ Error processing PDFs: {snapshot['error']}")
+    else:
+        stats = snapshot['stats']
+        st.success(
+            f"PDFs have been processed! {stats['rows']} rows for {stats['providers']} provider(s) "
+            f"from {stats['files']} file(s) in {stats['seconds']}s "
+            f"({stats['cached_files']} served from cache, {progress['fallback']} fallback hits)."
+        )
+        for filename, error in stats['errors']:
+            st.error(f"❌ Could not read {filename}: {error}")
+        if snapshot['warehouse_error']:
+            st.warning(f"⚠️ Statements were not added to the payment history: {snapshot['warehouse_error']}")
 
-# View Converted Excel Files
-with st.expander("📊 View Converted Excel Files"):
-    excel_files = [f for f in os.listdir(OUTPUT_DIR) if f.lower().endswith(".xlsx")] if os.path.exists(OUTPUT_DIR) else []
-    if excel_files:
-        selected_excel = st.selectbox("Select a converted Excel file to view", excel_files)
-        if selected_excel:
-            file_path = os.path.join(OUTPUT_DIR, selected_excel)
+st.fragment(run_every=1 if job_runner.active() else None)(show_conversion_job)()
+
+# View Converted Data (Parquet store; the Excel workbook is built only when
+# requested, and only the latest one is kept per session)
+with st.expander("📊 View Converted Data"):
+    providers = payment_store.list_providers(OUTPUT_DIR)
+    if providers:
+        selected_provider = st.selectbox("Select a provider to view", providers)
+        if selected_provider:
             try:
-                df = pd.read_excel(file_path)
+                df = load_provider_frame(selected_provider)
                 st.dataframe(df)
+                signature = payment_store.partition_signature(selected_provider, OUTPUT_DIR)
+                if st.button("Build Excel workbook", key="converted_workbook_build"):
+                    with st.spinner("Building workbook..."):
+                        data = payment_store.provider_excel_bytes(selected_provider, output_dir=OUTPUT_DIR)
+                    st.session_state.converted_workbook = (selected_provider, signature, data)
+                built = st.session_state.get('converted_workbook')
+                if built is not None and built[:2] == (selected_provider, signature):
+                    st.download_button(
+                        "⬇️ Download as Excel",
+                        data=built[2],
+                        file_name=f"{selected_provider}.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    )
             except Exception as e:
-                st.error(f"Could not read the Excel file: {e}")
+                st.error(f"Could not read the converted data: {e}")
     else:
-        st.info("No Excel files found in the output directory.")
+        st.info("No converted data found in the output directory.")
 
 # Main Compare Data Button
 st.header("🔍 Data Analysis")
 if st.button("Compare Data", type="primary", use_container_width=True):
-    if not attendance_file_path or not os.path.exists(attendance_file_path):
+    if attendance_data is None:
         st.error("Please upload the attendance file first!")
-    elif not excel_files:
-        st.error("No processed Excel files found. Please process PDFs first!")
+    elif not providers:
+        st.error("No converted data found. Please process PDFs first!")
     else:
         st.success("Starting comprehensive data analysis...")
         
-        # Load attendance data once
-        try:
-            attendance_df = pd.read_excel(attendance_file_path)
-            st.info(f"✅ Loaded attendance data with {len(attendance_df)} records")
-        except Exception as e:
-            st.error(f"Error loading attendance file: {e}")
-            st.stop()
-        
-        # Process each Excel file
-        for selected_file in excel_files:
-            st.subheader(f"📋 Analysis Results for: {selected_file}")
+        with metrics.recording(metrics.RunMetrics("compare")) as compare_run:
+            st.session_state.compare_metrics = compare_run
+            # Load attendance data once (cached across reruns by file hash)
+            try:
+                with metrics.stage("load_attendance"):
+                    attendance_index = load_attendance_index(attendance_hash, attendance_data)
+                st.info(f"✅ Loaded attendance data with {len(attendance_index)} records")
+            except Exception as e:
+                st.error(f"Error loading attendance file: {e}")
+                st.stop()
             
+            # Run the five analyses, recomputing only the providers and cases
+            # whose statements or attendance changed since the last run
             try:
-                # Load the provider table
-                PROVIDER_TABLE_PATH = os.path.join(OUTPUT_DIR, selected_file)
-                extracted_df = pd.read_excel(PROVIDER_TABLE_PATH, dtype={'Suffix': str})
-                provider_name = os.path.splitext(selected_file)[0]
-                
-                st.write(f"Processing {len(extracted_df)} records from {selected_file}")
-                
-                # Generate case numbers
-                extracted_df['Case number'] = extracted_df['Client'].astype(str) + '/' + extracted_df['Suffix']
-                
-                # === 1. ATTENDANCE COMPARISON ===
-                st.write("**1. 📊 Attendance Comparison Analysis**")
-                try:
-                    # Prepare attendance data
-                    attendance_grouped = attendance_df.groupby('Case number', as_index=False)['Attendance'].sum()
-                    attendance_grouped.rename(columns={'Attendance': 'Attendance_data'}, inplace=True)
-                    
-                    # Prepare extracted data
-                    extracted_comparison = extracted_df[['Case number', 'Days Attended']].copy()
-                    extracted_comparison.rename(columns={'Days Attended': 'Extracted_data'}, inplace=True)
-                    
-                    # Merge and calculate differences
-                    merged_df = pd.merge(attendance_grouped, extracted_comparison, on='Case number', how='inner')
-                    merged_df['Attendance_data'] = pd.to_numeric(merged_df['Attendance_data'], errors='coerce')
-                    merged_df['Extracted_data'] = pd.to_numeric(merged_df['Extracted_data'], errors='coerce')
-                    merged_df['Difference'] = merged_df['Attendance_data'] - merged_df['Extracted_data']
-                    
-                    # Filter mismatches
-                    mismatch_df = merged_df[merged_df['Difference'] != 0]
-                    
-                    # Save results
-                    output_file = f"attendance_comparison_result_{provider_name}.xlsx"
-                    OUTPUT_ANALYSIS_PATH = os.path.join(OUTPUT_ANALYZED_ATTANDACE, output_file)
-                    mismatch_df.to_excel(OUTPUT_ANALYSIS_PATH, index=False)
-                    
-                    st.write(f"   ✅ Attendance mismatches found: **{len(mismatch_df)}**")
-                    if len(mismatch_df) > 0:
-                        st.dataframe(mismatch_df.head(10), use_container_width=True)
-                        
-                except Exception as e:
-                    st.error(f"   ❌ Attendance comparison error: {e}")
-                    
-                    
-                    
-                    
-                    
-                    
-                    
-                
-# === 2. BRANCH NAMES ANALYSIS ===
-                st.write("**2. 🏢 Branch Names Analysis**")
-                try:
-                    # Set up attendance data for branch lookup
-                    attendance_lookup = attendance_df.set_index('Case number')
-                    
-                    # Collect branches
-                    branches = []
-                    for case_number in extracted_df['Case number']:
-                        if case_number in attendance_lookup.index:
-                            branch_value = attendance_lookup.loc[case_number, 'Branch']
-                            if isinstance(branch_value, pd.Series):
-                                for item in branch_value:
-                                    if pd.notna(item):
-                                        # Convert to string to handle mixed data types
-                                        branches.append(str(item))
-                            else:
-                                if pd.notna(branch_value):
-                                    # Convert to string to handle mixed data types
-                                    branches.append(str(branch_value))
-                    
-                    # Get unique branches - all are already strings from above conversion
-                    unique_branches = list(set(branches))
-                    branches_df = pd.DataFrame({'Branch': unique_branches})
-                    
-                    # Save results
-                    output_file = f"Branch_Names_{provider_name}.xlsx"
-                    OUTPUT_ANALYSIS_PATH = os.path.join(OUTPUT_ANALYZED_BRANCH, output_file)
-                    branches_df.to_excel(OUTPUT_ANALYSIS_PATH, index=False)
-                    
-                    st.write(f"   ✅ Unique branches found: **{len(branches_df)}**")
-                    if len(branches_df) > 0:
-                        # Display first 10 branches - no need to convert again since they're already strings
-                        st.write("   Branches:", ", ".join(unique_branches[:10]))
-                        
-                except Exception as e:
-                    st.error(f"   ❌ Branch analysis error: {e}")
-                    
-                    
-                    
-                    
-                    
-                
-                # === 3. FILTERED CASES ANALYSIS ===
-                st.write("**3. 🔍 Filtered Cases Analysis**")
-                try:
-                    # Use the unique branches found above
-                    if 'unique_branches' in locals() and unique_branches:
-                        # Filter attendance data by branches
-                        attendance_clean = attendance_df.dropna(subset=['Branch', 'Case number']).copy()
-                        attendance_clean['Branch'] = attendance_clean['Branch'].astype(str).str.strip()
-                        attendance_clean['Case number'] = attendance_clean['Case number'].astype(str).str.strip()
-                        
-                        # Filter by branches
-                        filtered_df = attendance_clean[attendance_clean['Branch'].isin(unique_branches)]
-                        output_df = filtered_df[['Case number', 'Branch']].drop_duplicates(subset=['Case number'])
-                        
-                        # Save results
-                        output_file = f"filtered_case_numbers_by_branch_{provider_name}.xlsx"
-                        OUTPUT_ANALYSIS_PATH = os.path.join(OUTPUT_ANALYZED_FILTER, output_file)
-                        output_df.to_excel(OUTPUT_ANALYSIS_PATH, index=False)
-                        
-                        st.write(f"   ✅ Filtered unique case numbers: **{len(output_df)}**")
-                        
-                        # === 4. MISSING CASES ANALYSIS ===
-                        st.write("**4. ❓ Missing Cases Analysis**")
-                        try:
-                            # Compare case numbers
-                            filtered_case_numbers = set(output_df['Case number'].astype(str).str.strip())
-                            extracted_case_numbers = set(extracted_df['Case number'].astype(str).str.strip())
-                            missing_case_numbers = filtered_case_numbers - extracted_case_numbers
-                            
-                            # Save missing cases
-                            missing_df = pd.DataFrame(list(missing_case_numbers), columns=['Missing Case number'])
-                            output_file = f"missing_case_numbers_{provider_name}.xlsx"
-                            output_path = os.path.join(OUTPUT_ANALYZED_MISSING, output_file)
-                            missing_df.to_excel(output_path, index=False)
-                            
-                            st.write(f"   ✅ Missing case numbers: **{len(missing_df)}**")
-                            if len(missing_df) > 0:
-                                st.dataframe(missing_df.head(10), use_container_width=True)
-                                
-                        except Exception as e:
-                            st.error(f"   ❌ Missing cases analysis error: {e}")
-                    
-                except Exception as e:
-                    st.error(f"   ❌ Filtered cases analysis error: {e}")
-                
-                # === 5. OVERPAID CASES ANALYSIS ===
-                st.write("**5. 💰 Overpaid Cases Analysis**")
-                try:
-                    # Prepare data for payment analysis
-                    extracted_payment = extracted_df.copy()
-                    extracted_payment['Rate'] = extracted_payment['Rate'].replace(r'[\$,]', '', regex=True).astype(float)
-                    extracted_payment['Gross Pay'] = extracted_payment['Gross Pay'].replace(r'[\$,]', '', regex=True).astype(float)
-                    
-                    # Sum attendance by case number
-                    attendance_sum = attendance_df.groupby('Case number', as_index=False)['Attendance'].sum()
-                    
-                    # Merge for payment calculation
-                    payment_merged = pd.merge(
-                        attendance_sum[['Case number', 'Attendance']],
-                        extracted_payment[['Case number', 'Rate', 'Gross Pay']],
-                        on='Case number',
-                        how='inner'
-                    )
-                    
-                    # Calculate expected payment
-                    payment_merged['Attendance'] = payment_merged['Attendance'].astype(float)
-                    payment_merged['Calculated Pay'] = payment_merged['Attendance'] * payment_merged['Rate']
-                    
-                    # Find overpaid cases
-                    overpaid_df = payment_merged[payment_merged['Calculated Pay'] > payment_merged['Gross Pay']].copy()
-                    overpaid_df['Amount Difference'] = (overpaid_df['Calculated Pay'] - overpaid_df['Gross Pay']).round(2)
-                    
-                    # Save results
-                    final_overpaid = overpaid_df[['Case number', 'Amount Difference']]
-                    output_file = f"attendance_overpaid_cases_filtered_{provider_name}.xlsx"
-                    output_path = os.path.join(OUTPUT_ANALYZED_LESS_PAID, output_file)
-                    final_overpaid.to_excel(output_path, index=False)
-                    
-                    st.write(f"   ✅ Overpaid cases found: **{len(final_overpaid)}**")
-                    if len(final_overpaid) > 0:
-                        st.dataframe(final_overpaid.head(10), use_container_width=True)
-                        
-                except Exception as e:
-                    st.error(f"   ❌ Overpaid cases analysis error: {e}")
-                
-                st.divider()
-                
+                with metrics.stage("load_statements"):
+                    provider_frames = {provider: load_provider_frame(provider) for provider in providers}
+                results, errors, reconciliation_state, plan = incremental_reconciliation.reconcile_incremental(
+                    attendance_index, attendance_hash, provider_frames, st.session_state.get('reconciliation_state'))
+                st.session_state.reconciliation_state = reconciliation_state
+                reused = [provider for provider, action in plan.items() if action == "reused"]
+                if reused:
+                    st.info(f"♻️ Reused previous results for {len(reused)} of {len(plan)} providers; "
+                            f"recomputed {len(plan) - len(reused)}")
+                # Results stay in memory (and Parquet); Excel is built only on download
+                analysis_sink = result_sink.ResultSink(results, OUTPUT_ANALYZED_RESULTS)
+                result_sink.ResultSink({provider: results[provider] for provider in plan if plan[provider] != "reused"},
+                                       OUTPUT_ANALYZED_RESULTS).save_parquet()
+                st.session_state.analysis_sink = analysis_sink
+                st.session_state.pop('result_workbook', None)
             except Exception as e:
-                st.error(f"❌ Error processing {selected_file}: {e}")
-                continue
+                st.error(f"❌ Error running the analyses: {e}")
+                st.stop()
+        
+        for key, message in errors.items():
+            st.error(f"❌ {key.replace('_', ' ').capitalize()} analysis error: {message}")
+        
+        # Show each provider's results
+        for provider_name, provider_results in results.items():
+            st.subheader(f"📋 Analysis Results for: {provider_name}")
+            st.write(f"Processing {len(provider_frames[provider_name])} records from {provider_name}")
+            
+            # === 1. ATTENDANCE COMPARISON ===
+            st.write("**1. 📊 Attendance Comparison Analysis**")
+            mismatch_df = provider_results['attendance_comparison']
+            if mismatch_df is not None:
+                st.write(f"   ✅ Attendance mismatches found: **{len(mismatch_df)}**")
+                if len(mismatch_df) > 0:
+                    st.dataframe(mismatch_df.head(10), use_container_width=True)
+            
+            # === 2. BRANCH NAMES ANALYSIS ===
+            st.write("**2. 🏢 Branch Names Analysis**")
+            branches_df = provider_results['branch_names']
+            if branches_df is not None:
+                st.write(f"   ✅ Unique branches found: **{len(branches_df)}**")
+                if len(branches_df) > 0:
+                    st.write("   Branches:", ", ".join(branches_df['Branch'].head(10)))
+            
+            # === 3. FILTERED CASES ANALYSIS ===
+            st.write("**3. 🔍 Filtered Cases Analysis**")
+            output_df = provider_results['filtered_cases']
+            if output_df is not None:
+                st.write(f"   ✅ Filtered unique case numbers: **{len(output_df)}**")
+                
+                # === 4. MISSING CASES ANALYSIS ===
+                st.write("**4. ❓ Missing Cases Analysis**")
+                missing_df = provider_results['missing_cases']
+                st.write(f"   ✅ Missing case numbers: **{len(missing_df)}**")
+                if len(missing_df) > 0:
+                    st.dataframe(missing_df.head(10), use_container_width=True)
+            
+            # === 5. OVERPAID CASES ANALYSIS ===
+            st.write("**5. 💰 Overpaid Cases Analysis**")
+            final_overpaid = provider_results['overpaid_cases']
+            if final_overpaid is not None:
+                st.write(f"   ✅ Overpaid cases found: **{len(final_overpaid)}**")
+                if len(final_overpaid) > 0:
+                    st.dataframe(final_overpaid.head(10), use_container_width=True)
+            
+            st.divider()
         
         st.success("🎉 **All analyses completed successfully!**")
         # st.info("📁 All results have been saved to the 'Analyzed Results' directories.")
 
-# # Data Management Section
-# st.header("🗑️ Data Management")
+# Download Analysis Results: Excel workbooks are generated from the in-memory
+# results only when requested
+with st.expander("📥 Download Analysis Results"):
+    analysis_sink = st.session_state.get('analysis_sink')
+    if analysis_sink is not None and analysis_sink.providers():
+        ALL_PROVIDERS = "All providers (consolidated workbook)"
+        choice = st.selectbox("Workbook", [ALL_PROVIDERS] + analysis_sink.providers(), key="result_workbook_choice")
+        if st.button("Build Excel workbook"):
+            with st.spinner("Building workbook..."):
+                if choice == ALL_PROVIDERS:
+                    data = analysis_sink.consolidated_workbook()
+                else:
+                    data = analysis_sink.provider_workbook(choice)
+            st.session_state.result_workbook = (choice, data)
+        built = st.session_state.get('result_workbook')
+        if built is not None and built[0] == choice:
+            file_name = "analysis_results_all_providers.xlsx" if choice == ALL_PROVIDERS else f"analysis_results_{choice}.xlsx"
+            st.download_button(
+                "⬇️ Download workbook",
+                data=built[1],
+                file_name=file_name,
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            )
+    else:
+        st.info("Run Compare Data to download its results.")
+
+# Payment History: questions across statement periods, answered from the
+# payment warehouse that every conversion and attendance upload feeds
+@st.fragment
+def show_payment_history():
+    history_periods = payment_warehouse.periods()
+    if not history_periods:
+        st.info("Process PDFs or upload an attendance export to start the payment history.")
+        return
+    since = st.selectbox("From period", ["All periods"] + sorted(history_periods), key="history_since")
+    since = None if since == "All periods" else since
+    case_tab, underpaid_tab, periods_tab = st.tabs(["Case history", "Repeat underpayments", "Periods"])
+    with case_tab:
+        case_number = st.text_input("Case number (Client/Suffix, e.g. 40606786/05)", key="history_case")
+        if case_number:
+            history = payment_warehouse.case_history(case_number, since)
+            if history.empty:
+                st.info(f"No payments or attendance found for {case_number}.")
+            else:
+                st.dataframe(history, hide_index=True, use_container_width=True)
+    with underpaid_tab:
+        min_periods = st.number_input("Underpaid (attendance above paid days) in at least this many periods",
+                                      min_value=1, value=2, step=1, key="history_min_periods")
+        st.write("**By branch**")
+        st.dataframe(payment_warehouse.underpayments_by_branch(min_periods, since), hide_index=True,
+                     use_container_width=True)
+        st.write("**By case**")
+        st.dataframe(payment_warehouse.repeat_underpayments(min_periods, since), hide_index=True,
+                     use_container_width=True)
+    with periods_tab:
+        st.dataframe(payment_warehouse.period_summary(), hide_index=True, use_container_width=True)
 
-# col1, col2 = st.columns(2)
+with st.expander("🗄️ Payment History"):
+    try:
+        show_payment_history()
+    except Exception as e:
+        st.error(f"❌ Could not read the payment history: {e}")
 
-# with col1:
-#     if st.button("🔄 Reset Current Session", type="secondary", use_container_width=True):
-#         if clear_all_data():
-#             # Reinitialize directories
-#             initialize_directories()
-#             # Reset session state
-#             st.session_state.session_initialized = False
-#             st.success("✅ Current session has been reset!")
-#             st.info("🔄 Page will refresh to start a clean session.")
-#             st.rerun()
-#         else:
-#             st.error("❌ Failed to reset session data.")
+# Metrics panel: stage timings, counters and parse outcomes of the latest
+# conversion and Compare Data runs, exportable as JSON or a Prometheus textfile
+def show_run_metrics(title, run):
+    st.write(f"**{title}**")
+    run_info = run.to_dict()
+    peak = run_info['peak_rss_delta_bytes']
+    memory = f", memory +{peak / 1024 / 1024:.0f} MB at peak" if peak is not None else ""
+    st.caption(f"{run_info['seconds']:.2f}s wall time{memory}")
+    if run.stages:
+        stages_df = pd.DataFrame(
+            [(stage, entry['seconds'], entry['calls']) for stage, entry in run.stages.items()],
+            columns=["Stage", "Seconds", "Calls"]).sort_values("Seconds", ascending=False)
+        st.dataframe(stages_df, hide_index=True, use_container_width=True)
+    if run.counters:
+        st.write(", ".join(f"{name}: **{value:g}**" for name, value in run.counters.items()))
+    if run.files:
+        rates = run.parse_rates()
+        files_df = pd.DataFrame([
+            {"File": filename, "Pages": totals["pages"], "Rows": totals["rows"],
+             "Full": totals["full"], "Padded (fallback)": totals["padded"], "Rejected": totals["rejected"],
+             "Reject rate": f"{rates[filename]['rejected']:.1%}",
+             "Extract s": round(totals["extract_seconds"], 3), "Parse s": round(totals["parse_seconds"], 3)}
+            for filename, totals in run.files.items()])
+        st.dataframe(files_df, hide_index=True, use_container_width=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("⬇️ Metrics JSON", data=run.to_json(), file_name=f"{run.name}_metrics.json",
+                           mime="application/json", key=f"metrics_json_{run.name}")
+    with col2:
+        st.download_button("⬇️ Prometheus textfile", data=run.to_prometheus(), file_name=f"{run.name}.prom",
+                           mime="text/plain", key=f"metrics_prom_{run.name}")
 
-# with col2:
-#     if st.button("🗑️ Clear All Data", type="secondary", use_container_width=True):
-#         try:
-#             if clear_all_data():
-#                 initialize_directories()
-#                 st.success("✅ All data has been cleared successfully!")
-#             else:
-#                 st.error("❌ Failed to clear all data.")
-#         except Exception as e:
-#             st.error(f"❌ Error while clearing data: {e}")
+with st.expander("📈 Run Metrics"):
+    latest_job = job_runner.latest()
+    compare_metrics = st.session_state.get('compare_metrics')
+    if latest_job is not None and not latest_job.active:
+        show_run_metrics("PDF processing", latest_job.metrics)
+    if compare_metrics is not None:
+        show_run_metrics("Compare Data", compare_metrics)
+    if (latest_job is None or latest_job.active) and compare_metrics is None:
+        st.info("Process PDFs or compare data to see run metrics.")
 
 # Footer info
 st.markdown("---")
 st.markdown(
     """
     <div style='text-align: center; color: #666; font-size: 0.8em;'>
-     All files are stored temporarily and will be removed when the session ends
+     Uploaded files are stored temporarily and will be removed when the session ends;
+     converted statements and attendance totals are kept in the payment history
     </div>
     """, 
     unsafe_allow_html=True
-)
\ No newline at end of file
+)
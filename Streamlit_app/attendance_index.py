@@ -0,0 +1,40 @@
+import hashlib
+import pandas as pd
+import attendance_loader
+import metrics
+# Attendance data prepared once for every Compare Data analysis.
+# Build one AttendanceIndex per uploaded attendance file (app.py caches it
+# by file hash) and let each analysis read the pieces it needs instead of
+# re-deriving them per provider.
+def file_hash(data):
+    """SHA-256 of file bytes, used as the cache key for an attendance file"""
+    return hashlib.sha256(data).hexdigest()
+
+class AttendanceIndex:
+    """Per-case sums and case <-> branch mappings of an attendance export"""
+
+    def __init__(self, attendance_df):
+        # Case numbers and branches stripped once, as categoricals
+        attendance_df = attendance_loader.normalize_attendance(attendance_df)
+        self.df = attendance_df
+        # Total attendance per case number (analyses 1 and 5)
+        case_sums = attendance_df.groupby('Case number', observed=True)['Attendance'].sum()
+        self.case_sums = pd.DataFrame({'Case number': case_sums.index.astype(object), 'Attendance': case_sums.values})
+        # (Case number, Branch) of every row with both, in row order, for the
+        # batched joins of analyses 2 and 3
+        clean = attendance_df.dropna(subset=['Branch', 'Case number'])
+        self.case_branch_pairs = pd.DataFrame({
+            'Case number': clean['Case number'].astype(object),
+            'Branch': clean['Branch'].astype(object),
+        }).reset_index(drop=True)
+
+    @classmethod
+    def from_excel(cls, path_or_buffer, digest=None, use_sidecar=True):
+        """Index of an export, read column-pruned (or from its Parquet sidecar)"""
+        with metrics.stage('attendance_read'):
+            attendance_df = attendance_loader.load_attendance(path_or_buffer, digest, use_sidecar)
+        with metrics.stage('attendance_index'):
+            return cls(attendance_df)
+
+    def __len__(self):
+        return len(self.df)
@@ -0,0 +1,212 @@
+import hashlib
+import io
+import os
+import re
+import uuid
+import zipfile
+from datetime import datetime
+import xml.etree.ElementTree as ET
+import pandas as pd
+import metrics
+# Typed, column-pruned loading of attendance exports.
+# The analyses only use Case number, Attendance and Branch out of the ~70
+# columns of an export, so the .xlsx sheet is streamed and only those three
+# columns are kept (falling back to pandas for anything that is not a plain
+# .xlsx). Case numbers and branches are stripped once and stored as
+# categoricals, attendance as a number. The normalized table is written to a
+# Parquet sidecar keyed by the file's SHA-256, so loading the same export
+# again skips Excel entirely.
+ATTENDANCE_COLUMNS = ['Case number', 'Attendance', 'Branch']
+# Bump when the normalized table changes, so old sidecars are not reused
+LOADER_VERSION = 1
+sidecar_dir = os.environ.get("CARETAKER_ATTENDANCE_CACHE_DIR", ".attendance_cache")
+max_sidecars = int(os.environ.get("CARETAKER_ATTENDANCE_CACHE_ENTRIES", "16"))
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+# Exports name their first column after the month they cover, e.g. "March - 2025"
+PERIOD_HEADER_RE = re.compile(r'^([A-Za-z]+)\s*-\s*(\d{4})$')
+
+def source_bytes(path_or_buffer):
+    if isinstance(path_or_buffer, (str, os.PathLike)):
+        with open(path_or_buffer, "rb") as f:
+            return f.read()
+    if isinstance(path_or_buffer, io.BytesIO):
+        return path_or_buffer.getvalue()
+    if hasattr(path_or_buffer, "read"):
+        return path_or_buffer.read()
+    return bytes(path_or_buffer)
+
+def first_sheet_path(workbook_zip):
+    """Path inside the .xlsx of the first worksheet, the one pd.read_excel reads"""
+    workbook = ET.fromstring(workbook_zip.read("xl/workbook.xml"))
+    rel_id = workbook.find(f"{NS}sheets/{NS}sheet").get(f"{REL_NS}id")
+    rels = ET.fromstring(workbook_zip.read("xl/_rels/workbook.xml.rels"))
+    for rel in rels.iter(f"{PKG_REL_NS}Relationship"):
+        if rel.get("Id") == rel_id:
+            target = rel.get("Target")
+            return target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+    raise ValueError("Workbook has no first worksheet")
+
+def shared_strings(workbook_zip):
+    if "xl/sharedStrings.xml" not in workbook_zip.namelist():
+        return []
+    strings = []
+    with workbook_zip.open("xl/sharedStrings.xml") as f:
+        for _, element in ET.iterparse(f):
+            if element.tag == f"{NS}si":
+                # Plain text, or the runs of rich text (phonetic hints excluded)
+                texts = [t.text or "" for t in element.findall(f"{NS}t")]
+                texts += [t.text or "" for t in element.findall(f"{NS}r/{NS}t")]
+                strings.append("".join(texts))
+                element.clear()
+    return strings
+
+def cell_value(cell, strings):
+    cell_type = cell.get("t")
+    if cell_type == "inlineStr":
+        return "".join(t.text or "" for t in cell.iter(f"{NS}t"))
+    value = cell.find(f"{NS}v")
+    if value is None or value.text is None:
+        return None
+    if cell_type == "s":
+        return strings[int(value.text)]
+    if cell_type in ("str", "e"):
+        return value.text
+    if cell_type == "b":
+        return value.text == "1"
+    number = float(value.text)
+    return int(number) if number.is_integer() else number
+
+def read_xlsx_columns(data, columns):
+    """{column: values} of the named header columns of the first sheet.
+
+    Cells outside those columns are skipped without being converted, which is
+    most of the work on a wide export.
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as workbook_zip:
+        strings = shared_strings(workbook_zip)
+        header = None
+        wanted = None
+        values = {column: [] for column in columns}
+        row = {}
+        with workbook_zip.open(first_sheet_path(workbook_zip)) as f:
+            for _, element in ET.iterparse(f):
+                if element.tag == f"{NS}c":
+                    letters = element.get("r").rstrip("0123456789")
+                    if wanted is None or letters in wanted:
+                        row[letters] = cell_value(element, strings)
+                    element.clear()
+                elif element.tag == f"{NS}row":
+                    if header is None:
+                        header = {str(name).strip(): letters for letters, name in row.items() if name is not None}
+                        missing = [column for column in columns if column not in header]
+                        if missing:
+                            raise KeyError(f"Attendance file has no {', '.join(missing)} column")
+                        wanted = {header[column]: column for column in columns}
+                    else:
+                        for letters, column in wanted.items():
+                            values[column].append(row.get(letters))
+                    row = {}
+                    element.clear()
+    return values
+
+def header_names(data):
+    """Header row of the first sheet, without reading the rest of it"""
+    with zipfile.ZipFile(io.BytesIO(data)) as workbook_zip:
+        strings = shared_strings(workbook_zip)
+        names = []
+        with workbook_zip.open(first_sheet_path(workbook_zip)) as f:
+            for _, element in ET.iterparse(f):
+                if element.tag == f"{NS}c":
+                    names.append(cell_value(element, strings))
+                elif element.tag == f"{NS}row":
+                    return names
+    return names
+
+def report_period(path_or_buffer):
+    """Period an export covers ("YYYY-MM"), from its "<Month> - <YYYY>" header, or None"""
+    data = source_bytes(path_or_buffer)
+    try:
+        names = header_names(data)
+    except Exception:
+        names = list(pd.read_excel(io.BytesIO(data), nrows=0).columns)
+    for name in names:
+        match = PERIOD_HEADER_RE.match(str(name).strip())
+        if match:
+            try:
+                return datetime.strptime(f"{match.group(1)} {match.group(2)}", "%B %Y").strftime("%Y-%m")
+            except ValueError:
+                continue
+    return None
+
+def read_attendance(path_or_buffer):
+    """The Case number, Attendance and Branch columns of an export, normalized"""
+    data = source_bytes(path_or_buffer)
+    try:
+        columns = read_xlsx_columns(data, ATTENDANCE_COLUMNS)
+    except KeyError:
+        raise
+    except Exception:
+        # Not a plain .xlsx (e.g. legacy .xls): let pandas pick the engine
+        return normalize_attendance(pd.read_excel(io.BytesIO(data), usecols=ATTENDANCE_COLUMNS))
+    return normalize_attendance(pd.DataFrame(columns))
+
+def normalize_text(values):
+    """Stripped strings (NaN kept) as a categorical"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    text = values.where(values.isna(), values.astype(str).str.strip())
+    return text.astype("category")
+
+def normalize_attendance(attendance_df):
+    """Three-column attendance table with categorical keys and numeric attendance"""
+    return pd.DataFrame({
+        'Case number': normalize_text(attendance_df['Case number']),
+        'Attendance': pd.to_numeric(attendance_df['Attendance'], errors='coerce'),
+        'Branch': normalize_text(attendance_df['Branch']),
+    })
+
+def sidecar_path(digest):
+    return os.path.join(sidecar_dir, f"{digest}-v{LOADER_VERSION}.parquet")
+
+def load_attendance(path_or_buffer, digest=None, use_sidecar=True):
+    """Normalized attendance table, from the Parquet sidecar when there is one"""
+    data = source_bytes(path_or_buffer)
+    if not use_sidecar:
+        return read_attendance(data)
+    path = sidecar_path(digest or hashlib.sha256(data).hexdigest())
+    if os.path.exists(path):
+        try:
+            with metrics.stage('attendance_sidecar_read'):
+                attendance_df = pd.read_parquet(path)
+            os.utime(path)
+            return attendance_df
+        except Exception as e:
+            print(f":warning: Ignoring unreadable attendance sidecar '{path}': {e}")
+    attendance_df = read_attendance(data)
+    try:
+        os.makedirs(sidecar_dir, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        attendance_df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        evict_sidecars()
+    except OSError as e:
+        print(f":warning: Could not write attendance sidecar '{path}': {e}")
+    return attendance_df
+
+def evict_sidecars():
+    """Keep only the most recently used sidecars"""
+    entries = []
+    for name in os.listdir(sidecar_dir):
+        if name.endswith(".parquet"):
+            path = os.path.join(sidecar_dir, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue
+    for _, path in sorted(entries, reverse=True)[max_sidecars:]:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
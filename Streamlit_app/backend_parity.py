@@ -0,0 +1,81 @@
+import argparse
+import sys
+import time
+from collections import Counter
+from payment_store import columns
+from pdf_converter import extract_page_range
+from text_backends import BACKENDS
+# Parity check: run two text backends over the same PDF and diff the rows
+# that the parser produces from each.
+#   python backend_parity.py input/statement.pdf --backends pdfplumber pypdfium2
+# extract_rows, describe_row and diff_rows are shared with extractor_parity.py.
+def extract_rows(pdf_path, backend, extractor="text"):
+    """(rows, provider name, page stats, seconds) of one PDF"""
+    page_stats = []
+    started = time.perf_counter()
+    rows, provider_headers = extract_page_range(pdf_path, backend=backend, on_page=page_stats.append,
+                                                extractor=extractor)
+    elapsed = time.perf_counter() - started
+    provider_name = ' '.join(provider_headers[-1].split()) if provider_headers else None
+    return rows, provider_name, page_stats, elapsed
+def describe_row(row):
+    return f"{row[0]}/{row[1]} {row[2]}"
+def diff_rows(rows_a, rows_b):
+    """(differing, only_a, only_b): rows of the same case on both sides that
+    were read differently, as (row_a, row_b) pairs, and the remaining rows
+    found by only one side"""
+    counts_a = Counter(tuple(row) for row in rows_a)
+    counts_b = Counter(tuple(row) for row in rows_b)
+    # Pair up differing rows by case number so we can show which columns changed
+    by_case_b = {}
+    for row in (counts_b - counts_a).elements():
+        by_case_b.setdefault((row[0], row[1]), []).append(row)
+    differing = []
+    only_a = []
+    for row in (counts_a - counts_b).elements():
+        candidates = by_case_b.get((row[0], row[1]))
+        if candidates:
+            differing.append((row, candidates.pop(0)))
+        else:
+            only_a.append(row)
+    only_b = [row for case_rows in by_case_b.values() for row in case_rows]
+    return differing, only_a, only_b
+def describe_diff(row_a, row_b):
+    diffs = [f"{col}: {a!r} != {b!r}" for col, a, b in zip(columns, row_a, row_b) if a != b]
+    return f"{describe_row(row_a)} differs -> " + "; ".join(diffs)
+def compare_backends(pdf_path, backend_a, backend_b, max_report=20):
+    rows_a, provider_a, _, time_a = extract_rows(pdf_path, backend_a)
+    rows_b, provider_b, _, time_b = extract_rows(pdf_path, backend_b)
+    print(f":page_facing_up: {pdf_path}")
+    print(f"   {backend_a}: {len(rows_a)} rows in {time_a:.2f}s, provider={provider_a}")
+    print(f"   {backend_b}: {len(rows_b)} rows in {time_b:.2f}s, provider={provider_b}")
+    differing, only_a, only_b = diff_rows(rows_a, rows_b)
+    for row_a, row_b in differing[:max_report]:
+        print(f"   :x: {describe_diff(row_a, row_b)}")
+    for row in only_a[:max(0, max_report - len(differing))]:
+        print(f"   :x: {describe_row(row)} only from {backend_a}")
+    for row in only_b[:max(0, max_report - len(differing) - len(only_a))]:
+        print(f"   :x: {describe_row(row)} only from {backend_b}")
+    matched = provider_a == provider_b and not differing and not only_a and not only_b
+    if matched:
+        ratio = time_a / time_b if time_b else 0
+        print(f"   :white_tick: Rows identical ({backend_a}/{backend_b} time ratio {ratio:.1f}x)")
+    else:
+        if provider_a != provider_b:
+            print(f"   :x: Provider mismatch: {provider_a!r} != {provider_b!r}")
+        print(f"   :warning: {len(differing)} rows differ, {len(only_a)} rows only from {backend_a}, "
+              f"{len(only_b)} rows only from {backend_b}")
+    return matched
+def main():
+    parser = argparse.ArgumentParser(description="Diff parsed payment rows between two text backends.")
+    parser.add_argument("pdfs", nargs="+", help="PDF files to check")
+    parser.add_argument("--backends", nargs=2, default=["pdfplumber", "pypdfium2"],
+                        choices=list(BACKENDS), metavar="BACKEND",
+                        help="Two backends to compare (default: pdfplumber pypdfium2)")
+    args = parser.parse_args()
+    all_matched = True
+    for pdf_path in args.pdfs:
+        all_matched &= compare_backends(pdf_path, *args.backends)
+    sys.exit(0 if all_matched else 1)
+if __name__ == "__main__":
+    main()
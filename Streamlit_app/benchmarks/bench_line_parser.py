@@ -0,0 +1,142 @@
+import argparse
+import glob
+import os
+import random
+import re
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pdf_converter import parse_line, statement_columns
+from text_backends import iter_page_texts
+# Micro-benchmark: legacy parse_payment_line + fallback_parse versus the
+# single-pass compiled parser, over payment lines taken from real statements
+# and mutated to cover glued currency, short tails and rejected lines.
+#   python benchmarks/bench_line_parser.py --lines 200000
+# Legacy parser, kept verbatim as the reference for output and speed
+def legacy_parse_payment_line(line):
+    line = re.sub(r'(\$\d+(?:,\d{3})*(?:\.\d{2})?)(\$\d+(?:,\d{3})*(?:\.\d{2})?)', r'\1 \2', line)
+    parts = line.split()
+    if len(parts) < 20:
+        return None
+    row_data = []
+    try:
+        client, suffix = parts[0], parts[1]
+        if not (re.match(r'^\d{8}$', client) and re.match(r'^\d{2}$', suffix)):
+            return None
+        row_data += [client, suffix]
+        name_parts = []
+        i = 2
+        while i < len(parts) and re.match(r'^[A-Za-z]+$', parts[i]):
+            name_parts.append(parts[i])
+            i += 1
+        if not name_parts:
+            return None
+        row_data.append(' '.join(name_parts))
+        if i >= len(parts) or not re.match(r'^[WD]$', parts[i]):
+            return None
+        row_data.append(parts[i]); i += 1
+        if i >= len(parts) or not re.match(r'^\d+\.\d{2}$', parts[i]):
+            return None
+        row_data.append(parts[i]); i += 1
+        for _ in range(17):
+            if i >= len(parts):
+                return None
+            row_data.append(parts[i]); i += 1
+        if len(row_data) == len(statement_columns):
+            return row_data
+        else:
+            return None
+    except:
+        return None
+def legacy_fallback_parse(line):
+    pattern = r'''
+        (\d{8})\s+(\d{2})\s+([A-Za-z]+\s+[A-Za-z]+)\s+([WD])\s+(\d+\.\d{2})\s*
+        (\$\d+(?:,\d{3})*(?:\.\d{2})?)\s*(\$\d+(?:,\d{3})*(?:\.\d{2})?)\s+([A-Z])\s+
+        (\d{1,2}/\d{2})\s+(.+)
+    '''
+    match = re.match(pattern, line, re.VERBOSE)
+    if match:
+        groups = list(match.groups())
+        remaining = groups[9].split()
+        result = groups[:9] + remaining
+        if len(result) >= len(statement_columns):
+            return result[:len(statement_columns)]
+        elif len(result) >= 20:
+            while len(result) < len(statement_columns):
+                result.append("")
+            return result
+    return None
+def legacy_parse(line):
+    return legacy_parse_payment_line(line) or legacy_fallback_parse(line)
+def compiled_parse(line):
+    return parse_line(line)[0]
+# Collect the 8-digit client lines from the statements in input_dir
+def real_lines(input_dir, backend):
+    lines = []
+    for pdf_path in sorted(glob.glob(os.path.join(input_dir, "*.pdf"))):
+        for text in iter_page_texts(pdf_path, backend=backend):
+            for line in text.split('\n'):
+                line = line.strip()
+                if re.match(r'^\d{8}', line):
+                    lines.append(line)
+    return lines
+# Grow the real lines into a corpus of n_lines with realistic variations
+def build_corpus(seed_lines, n_lines, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    while len(corpus) < n_lines:
+        line = rng.choice(seed_lines)
+        parts = line.split(' ')
+        parts[0] = f"{rng.randrange(10**7, 10**8):08d}"
+        line = ' '.join(parts)
+        variant = rng.random()
+        if variant < 0.15:
+            # Glue rate and subtotal, as some statements print them
+            line = re.sub(r'(\$[\d,.]+) (\$[\d,.]+)', r'\1\2', line, count=1)
+        elif variant < 0.20:
+            # Glue a later money column to its neighbour
+            line = line.replace(' $0.00 ', '$0.00 ', 1)
+        elif variant < 0.25:
+            # Short tail: drop the last one to three columns
+            line = ' '.join(line.split()[:-rng.randint(1, 3)])
+        elif variant < 0.28:
+            # Names the grammar rejects
+            line = line.replace(parts[2], parts[2] + "-X", 1)
+        corpus.append(line)
+    return corpus
+def lines_per_second(parse, corpus, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for line in corpus:
+            parse(line)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(corpus) / best
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the payment line parser.")
+    parser.add_argument("--input-dir", default="input", help="Directory of real statement PDFs")
+    parser.add_argument("--backend", default="pypdfium2", help="Text backend used to read the PDFs")
+    parser.add_argument("--lines", type=int, default=200000, help="Corpus size")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing runs (best is reported)")
+    args = parser.parse_args()
+    seed_lines = real_lines(args.input_dir, args.backend)
+    if not seed_lines:
+        sys.exit(f"No payment lines found in {args.input_dir}")
+    corpus = build_corpus(seed_lines, args.lines)
+    # Outputs must match line for line before timings mean anything
+    mismatches = [line for line in corpus if legacy_parse(line) != compiled_parse(line)]
+    if mismatches:
+        print(f":x: {len(mismatches)} lines parse differently, e.g. {mismatches[0]!r}")
+        sys.exit(1)
+    rules = {}
+    for line in corpus:
+        rule = parse_line(line)[1]
+        rules[rule] = rules.get(rule, 0) + 1
+    print(f":white_tick: {len(corpus)} lines ({len(seed_lines)} real) parse identically; rules: {rules}")
+    before = lines_per_second(legacy_parse, corpus, args.repeat)
+    after = lines_per_second(compiled_parse, corpus, args.repeat)
+    print(f"   legacy parser:   {before:>12,.0f} lines/sec")
+    print(f"   compiled parser: {after:>12,.0f} lines/sec ({after / before:.1f}x)")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import glob
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Memory benchmark: peak RSS of batch vs streaming conversion as the
+# statement grows. The real PDFs in input/ are concatenated `copies` times
+# into one large statement, and each mode runs in a fresh process so
+# ru_maxrss measures that run alone.
+#   python benchmarks/bench_memory.py --copies 1 4 16 --backend pdfplumber
+def build_statement(input_dir, copies, dest_path):
+    import fitz
+    sources = sorted(glob.glob(os.path.join(input_dir, "*.pdf")))
+    merged = fitz.open()
+    for _ in range(copies):
+        for pdf_path in sources:
+            with fitz.open(pdf_path) as src:
+                merged.insert_pdf(src)
+    page_count = len(merged)
+    merged.save(dest_path)
+    merged.close()
+    return page_count
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+def run_child(mode, input_dir, output_dir, backend):
+    import contextlib
+    import io
+    import pdf_converter
+    baseline = peak_rss_mb()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == "stream":
+            stats = pdf_converter.convert_pdfs_streaming(input_dir, output_dir, backend=backend)
+        else:
+            _, stats = pdf_converter.convert_pdfs(input_dir, output_dir, workers=1, backend=backend, cache=False)
+    print(f"{stats['rows']} {stats['seconds']} {baseline:.1f} {peak_rss_mb():.1f}")
+def measure(mode, input_dir, backend):
+    with tempfile.TemporaryDirectory() as output_dir:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, input_dir, output_dir, backend],
+            capture_output=True, text=True, check=True,
+        )
+    rows, seconds, baseline, peak = result.stdout.split()
+    return int(rows), float(seconds), float(baseline), float(peak)
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run_child(*sys.argv[2:6])
+        return
+    parser = argparse.ArgumentParser(description="Peak memory of batch vs streaming conversion.")
+    parser.add_argument("--input-dir", default="input", help="Directory of real statement PDFs")
+    parser.add_argument("--copies", type=int, nargs="+", default=[1, 4, 16], help="Statement sizes, in copies of input/")
+    parser.add_argument("--backend", default="pdfplumber", help="Text extraction backend")
+    args = parser.parse_args()
+    print(f"{'pages':>6} {'rows':>8} {'mode':>7} {'seconds':>8} {'import MB':>10} {'peak MB':>8} {'growth MB':>10}")
+    for copies in args.copies:
+        with tempfile.TemporaryDirectory() as input_dir:
+            pages = build_statement(args.input_dir, copies, os.path.join(input_dir, "statement.pdf"))
+            for mode in ("batch", "stream"):
+                rows, seconds, baseline, peak = measure(mode, input_dir, args.backend)
+                print(f"{pages:>6} {rows:>8} {mode:>7} {seconds:>8.2f} {baseline:>10.1f} {peak:>8.1f} {peak - baseline:>10.1f}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import payment_store
+import pdf_converter
+import reconciliation
+import result_sink
+from attendance_index import AttendanceIndex
+from synthetic_data import generate
+# End-to-end benchmark on synthetic data: every stage of the converter and
+# each Compare Data analysis is timed separately at several scales. Each run
+# appends one JSON line per scale to the results file and is compared with
+# the previous run of the same scale/backend/workers, flagging stages that
+# got slower than --threshold.
+#   python benchmarks/bench_pipeline.py --rows 1000 10000 100000 --backend pypdfium2
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "bench_pipeline.jsonl")
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def timed(timings, stage, fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    timings[stage] = round(time.perf_counter() - started, 4)
+    return result
+
+def run_stages(statements_dir, attendance_path, work_dir, backend, workers):
+    """Time each pipeline stage once; returns (timings, row counts)"""
+    timings = {}
+    output_dir = os.path.join(work_dir, "output")
+    results_dir = os.path.join(work_dir, "Analyzed Results")
+    pdf_files = sorted(f for f in os.listdir(statements_dir) if f.lower().endswith(".pdf"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Converter: text extraction + parsing, then the Parquet store write
+        provider_data = timed(timings, "extract_parse", pdf_converter.process_pdfs, pdf_files, statements_dir,
+                              workers=workers, backend=backend, cache=False)
+        started = time.perf_counter()
+        for provider, data in provider_data.items():
+            payment_store.write_provider(provider, payment_store.typed_frame(data), output_dir=output_dir)
+        timings["store_write"] = round(time.perf_counter() - started, 4)
+        provider_frames = timed(timings, "store_read", lambda: {
+            provider: payment_store.read_provider(provider, output_dir=output_dir)
+            for provider in payment_store.list_providers(output_dir)})
+        # Compare Data: attendance index, then each analysis on the combined frame
+        # Always from the .xlsx, so the timing does not depend on a sidecar
+        index = timed(timings, "attendance_load", AttendanceIndex.from_excel, attendance_path, use_sidecar=False)
+        extracted = reconciliation.combine_providers(provider_frames)
+        extracted['Case number'] = extracted['Client'].astype(str) + '/' + extracted['Suffix']
+        timed(timings, "attendance_comparison", reconciliation.attendance_mismatches, index, extracted)
+        branches = timed(timings, "branch_names", reconciliation.provider_branches, index, extracted)
+        filtered = timed(timings, "filtered_cases", reconciliation.branch_cases, index, branches)
+        timed(timings, "missing_cases", reconciliation.missing_cases, filtered, extracted)
+        timed(timings, "overpaid_cases", reconciliation.overpaid_cases, index, extracted)
+        results, _ = timed(timings, "reconcile_all", reconciliation.reconcile, index, provider_frames)
+        timed(timings, "write_results", reconciliation.write_results, results, results_dir)
+        timed(timings, "write_results_parquet", result_sink.ResultSink(results, results_dir + " parquet").save_parquet)
+        timed(timings, "consolidated_workbook", result_sink.ResultSink(results).consolidated_workbook)
+    counts = {"pdf_files": len(pdf_files), "rows": sum(len(data) for data in provider_data.values()),
+              "providers": len(provider_data), "attendance_rows": len(index)}
+    return timings, counts
+
+def load_previous(results_file):
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def report_regressions(record, previous, threshold):
+    """Print each stage's ratio to the last matching run; returns the regressed stages"""
+    matches = [run for run in previous if all(run.get(key) == record[key] for key in ("rows", "backend", "workers"))]
+    if not matches:
+        return []
+    baseline = matches[-1]
+    print(f"   compared with the run of {baseline['timestamp']} ({baseline['commit']}):")
+    regressed = []
+    for stage, seconds in record["timings"].items():
+        before = baseline["timings"].get(stage)
+        if not before:
+            continue
+        ratio = seconds / before
+        flag = ""
+        # Ignore sub-10ms stages, where timer noise dominates
+        if ratio > threshold and seconds - before > 0.01:
+            regressed.append(stage)
+            flag = "  <-- slower"
+        print(f"   {stage:<22} {before:>9.3f}s -> {seconds:>9.3f}s  x{ratio:.2f}{flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every converter and Compare Data stage on synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000], help="Statement rows per scale (1k-1M)")
+    parser.add_argument("--providers", type=int, default=3, help="Providers in the synthetic data")
+    parser.add_argument("--backend", default=None, help="Text extraction backend")
+    parser.add_argument("--workers", type=int, default=1, help="Converter worker processes")
+    parser.add_argument("--data-dir", default=None, help="Keep generated data here and reuse it across runs")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSON-lines file the results are appended to")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+    backend = args.backend or pdf_converter.text_backends.default_backend
+    previous = load_previous(args.results)
+    regressions = {}
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as work_dir:
+            data_dir = os.path.join(args.data_dir or work_dir, f"rows_{rows}_providers_{args.providers}")
+            if not os.path.exists(os.path.join(data_dir, "attendance.xlsx")):
+                print(f":hammer_and_wrench: Generating {rows} synthetic rows in '{data_dir}'")
+                generate(rows, data_dir, providers=args.providers)
+            timings, counts = run_stages(os.path.join(data_dir, "statements"), os.path.join(data_dir, "attendance.xlsx"),
+                                         work_dir, backend, args.workers)
+        record = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "rows": rows,
+            "backend": backend,
+            "workers": args.workers,
+            "counts": counts,
+            "timings": timings,
+        }
+        print(f":stopwatch: {rows} rows ({counts['pdf_files']} PDFs, {backend}, {args.workers} worker(s)): "
+              f"{sum(timings.values()):.3f}s total")
+        for stage, seconds in timings.items():
+            print(f"   {stage:<22} {seconds:>9.3f}s")
+        regressed = report_regressions(record, previous, args.threshold)
+        if regressed:
+            regressions[rows] = regressed
+        with open(args.results, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    print(f":file_folder: Results appended to '{args.results}'")
+    for rows, stages in regressions.items():
+        print(f":warning: {rows} rows: slower than the previous run in {', '.join(stages)}")
+    if regressions:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import os
+import random
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Synthetic benchmark data: payment-statement PDFs in the statement line
+# layout the converter parses, plus a matching attendance workbook with
+# Case number / Branch / Attendance columns. Rows are spread over
+# `providers` providers; each provider gets its own branches, and the
+# attendance file is perturbed so every Compare Data analysis has work to do
+# (attendance mismatches, overpaid cases, cases missing from statements).
+#   python benchmarks/synthetic_data.py --rows 100000 --dest /tmp/synthetic
+LAST_NAMES = ["ADLER", "BERGER", "COHEN", "DAVIDSON", "EPSTEIN", "FISCHER", "GOLD", "HOROWITZ", "KATZ",
+              "LANDAU", "MILLER", "NEUMAN", "ROSEN", "SCHWARTZ", "WEISS"]
+FIRST_NAMES = ["ABRAHAM", "CHANA", "DAVID", "ESTHER", "LEAH", "MIRIAM", "MOSHE", "RIVKA", "SARA", "YOSEF"]
+RATES = [90.0, 100.0]
+# Page geometry matches the real statements (landscape letter)
+PAGE_WIDTH, PAGE_HEIGHT = 792, 612
+FONT_SIZE = 6
+LINE_HEIGHT = 8
+HEADER_LINES = 4
+
+def money(value):
+    return f"${value:,.2f}"
+
+def provider_name(provider_index):
+    return f"SYNTHETIC DAYCARE {chr(ord('A') + provider_index % 26)}{provider_index // 26 or ''} INC"
+
+def payment_case(rng, provider_index, row_index):
+    """One synthetic child on a provider's statement"""
+    return {
+        "client": f"{40000000 + provider_index * 1000000 + row_index:08d}",
+        "suffix": f"{rng.randint(1, 12):02d}",
+        "name": f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}",
+        "rate": rng.choice(RATES),
+        "days_attended": rng.randint(1, 22),
+        "days_absent": rng.randint(0, 6),
+    }
+
+def payment_line(rng, case):
+    """A statement line with all 23 columns; the rate is sometimes glued to the quantity"""
+    attended, absent = case["days_attended"], case["days_absent"]
+    approved = attended + absent
+    gross = case["rate"] * approved
+    fee_days = rng.randint(0, 2)
+    fee = 5.0 * fee_days
+    net = gross - fee
+    quantity_rate = f"1.00{money(case['rate'])}" if rng.random() < 0.5 else f"1.00 {money(case['rate'])}"
+    return (f"{case['client']} {case['suffix']} {case['name']} W {quantity_rate} {money(net)} I "
+            f"{rng.randint(1, 12)}/{rng.randint(24, 25)} {attended} {absent} {rng.randint(0, 80)} {absent} 1 0 "
+            f"{approved} {money(gross)} {fee_days} {money(fee)} {money(net)} N $0.00 {money(net)}")
+
+def write_statement(path, provider, lines, rows_per_page):
+    import fitz
+    doc = fitz.open()
+    for start in range(0, max(len(lines), 1), rows_per_page):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        header = [f"Provider {provider}", "Provider number 1000000", "Paid Period March 2025",
+                  "Client Suffix Name Rate Quantity Rate Subtotal Care"]
+        page.insert_text((20, 20), "\n".join(header + lines[start:start + rows_per_page]),
+                         fontsize=FONT_SIZE, lineheight=LINE_HEIGHT / FONT_SIZE)
+    doc.save(path)
+    doc.close()
+
+def write_attendance(path, rows):
+    """Write-only openpyxl workbook, so 1M-row files do not build a DOM in memory"""
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Attendance")
+    sheet.append(["Child Id", "Child Name", "Case number", "Branch", "Class", "Attendance"])
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+def generate(rows, dest, providers=3, branches_per_provider=4, rows_per_page=None, rows_per_file=50000, seed=0):
+    """Write statements/*.pdf and attendance.xlsx under dest; returns their paths"""
+    rng = random.Random(seed)
+    rows_per_page = rows_per_page or (PAGE_HEIGHT - 40) // LINE_HEIGHT - HEADER_LINES
+    statements_dir = os.path.join(dest, "statements")
+    os.makedirs(statements_dir, exist_ok=True)
+    attendance_rows = []
+    for provider_index in range(providers):
+        provider = provider_name(provider_index)
+        provider_rows = rows // providers + (1 if provider_index < rows % providers else 0)
+        branches = [f"BR{provider_index:02d}-{branch}" for branch in range(branches_per_provider)]
+        lines = []
+        for row_index in range(provider_rows):
+            case = payment_case(rng, provider_index, row_index)
+            lines.append(payment_line(rng, case))
+            attendance = case["days_attended"]
+            roll = rng.random()
+            if roll < 0.05:
+                # Attendance differs from the statement (analysis 1)
+                attendance += rng.randint(1, 3)
+            elif roll < 0.08:
+                # More attendance than was paid for (analysis 5)
+                attendance += case["days_absent"] + rng.randint(1, 3)
+            attendance_rows.append([row_index, case["name"].title(), f"{case['client']}/{case['suffix']}",
+                                    rng.choice(branches), "A", attendance])
+        # Children enrolled in the provider's branches but absent from its statements (analysis 4)
+        for extra in range(max(1, provider_rows // 50)):
+            attendance_rows.append([provider_rows + extra, "Missing Child", f"{90000000 + provider_index * 100000 + extra:08d}/01",
+                                    rng.choice(branches), "A", rng.randint(1, 22)])
+        for part, start in enumerate(range(0, max(len(lines), 1), rows_per_file)):
+            write_statement(os.path.join(statements_dir, f"{provider.replace(' ', '_').lower()}_{part:03d}.pdf"),
+                            provider, lines[start:start + rows_per_file], rows_per_page)
+    rng.shuffle(attendance_rows)
+    attendance_path = os.path.join(dest, "attendance.xlsx")
+    write_attendance(attendance_path, attendance_rows)
+    return statements_dir, attendance_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic statements and an attendance workbook.")
+    parser.add_argument("--rows", type=int, default=1000, help="Statement rows across all providers")
+    parser.add_argument("--providers", type=int, default=3, help="Number of providers")
+    parser.add_argument("--dest", required=True, help="Output directory")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+    statements_dir, attendance_path = generate(args.rows, args.dest, providers=args.providers, seed=args.seed)
+    print(f":white_tick: Wrote {args.rows} rows to '{statements_dir}' and '{attendance_path}'")
+
+if __name__ == "__main__":
+    main()
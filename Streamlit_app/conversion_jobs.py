@@ -0,0 +1,147 @@
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+import payment_warehouse
+import pdf_converter
+import workspaces
+# Background PDF conversion for the Streamlit app.
+# Each session owns a JobRunner (kept in st.session_state) with one worker
+# thread, so a conversion keeps running across reruns while the user browses
+# other sections. The job collects progress events from pdf_converter and
+# exposes a snapshot for the UI to poll; cancelling sets the event the
+# converter checks between pages. With a warehouse path, the converted rows
+# are also loaded into the payment warehouse from the job's thread.
+# Jobs of several sessions run side by side in one process; the pypdfium2
+# and PyMuPDF backends serialize on the engine locks in text_backends.py.
+# A job given its session's workspace keeps touching it while it runs, so
+# the janitor does not evict a workspace a long conversion is writing to.
+# Seconds between workspace touches of a running job
+TOUCH_INTERVAL_SECONDS = 30
+class ConversionJob:
+    """One convert_pdfs run, with its progress, result and cancel event"""
+
+    def __init__(self, input_dir, output_dir, warehouse_path=None, workspace=None, **options):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.warehouse_path = warehouse_path
+        self.workspace = workspace
+        self.touched = 0.0
+        self.options = options
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.status = "queued"
+        self.events = collections.deque(maxlen=50)
+        self.progress = {"file": None, "file_index": 0, "files": 0, "page": None, "pages": None,
+                         "rows": 0, "fallback": 0, "cached_files": 0}
+        self.provider_frames = None
+        self.stats = None
+        self.error = None
+        self.warehouse_error = None
+        self.started = None
+        self.finished = None
+        self.applied = False
+        self.metrics = metrics.RunMetrics("convert")
+
+    def touch_workspace(self, force=False):
+        if self.workspace is None:
+            return
+        now = time.time()
+        if force or now - self.touched >= TOUCH_INTERVAL_SECONDS:
+            self.touched = now
+            try:
+                workspaces.touch(self.workspace)
+            except OSError:
+                pass
+
+    def on_progress(self, event):
+        self.touch_workspace()
+        with self.lock:
+            self.events.append(event)
+            self.progress.update({key: event[key] for key in ("file", "file_index", "files", "page", "pages")})
+            self.progress["rows"] += event["rows"]
+            self.progress["fallback"] += event["fallback"]
+            self.progress["cached_files"] += event["cached"]
+
+    def run(self):
+        with self.lock:
+            if self.cancel_event.is_set():
+                self.status = "cancelled"
+                return
+            self.status = "running"
+            self.started = time.time()
+            self.metrics.started = self.started
+        self.touch_workspace(force=True)
+        try:
+            with metrics.recording(self.metrics):
+                provider_frames, stats = pdf_converter.convert_pdfs(
+                    self.input_dir, self.output_dir, progress=self.on_progress, cancel=self.cancel_event,
+                    **self.options)
+                if self.warehouse_path:
+                    self.touch_workspace(force=True)
+                    try:
+                        payment_warehouse.add_payments(provider_frames, self.warehouse_path)
+                    except Exception as e:
+                        # The conversion itself succeeded; only report this
+                        self.warehouse_error = str(e)
+        except pdf_converter.ConversionCancelled:
+            status = "cancelled"
+        except Exception as e:
+            self.error = str(e)
+            status = "failed"
+        else:
+            self.provider_frames, self.stats = provider_frames, stats
+            status = "done"
+        self.touch_workspace(force=True)
+        with self.lock:
+            self.status = status
+            self.finished = time.time()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def fraction(self):
+        """Completed share of the run, counting partial progress through the current file"""
+        with self.lock:
+            progress = dict(self.progress)
+        if not progress["files"]:
+            return 0.0
+        done = progress["file_index"] - 1
+        if progress["pages"]:
+            done += progress["page"] / progress["pages"]
+        else:
+            done += 1
+        return min(done / progress["files"], 1.0)
+
+    def snapshot(self):
+        with self.lock:
+            return {"status": self.status, "progress": dict(self.progress), "events": list(self.events),
+                    "error": self.error, "warehouse_error": self.warehouse_error, "stats": self.stats}
+
+class JobRunner:
+    """A session's single-thread queue of conversion jobs"""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-conversion")
+        self.jobs = []
+
+    def submit(self, job):
+        self.jobs.append(job)
+        self.executor.submit(job.run)
+        return job
+
+    def latest(self):
+        return self.jobs[-1] if self.jobs else None
+
+    def active(self):
+        return any(job.active for job in self.jobs)
+
+    def shutdown(self):
+        for job in self.jobs:
+            job.cancel()
+        self.executor.shutdown(wait=False)
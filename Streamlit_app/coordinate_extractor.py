@@ -0,0 +1,192 @@
+import re
+import text_backends
+from text_backends import pdf_input, is_path, open_pymupdf, mupdf_lock, pdfium_lock
+# Two-stage, coordinate-based page extraction (PDF_CONVERTER_EXTRACTOR=coordinates).
+# Stage 1 probes each page's plain text with the selected engine and skips
+# pages without a client line (cover, summary and totals pages). PyMuPDF
+# and pypdfium2 probe before reading any characters; pdfplumber has no
+# cheaper text than its characters, so its pages are probed on their lines.
+# Stage 2 reads the characters of the remaining pages with their positions,
+# groups them into lines by height on the page and assigns each run of
+# characters to a statement column by its horizontal centre, using the fixed
+# column boundaries of the statement layout. Glued values such as
+# "1.00$100.00" fall into separate columns, and names of any shape (e.g.
+# hyphenated) stay in the Name column, so no token guessing is needed.
+# Each page comes back as a list of lines, a line being a list of
+# (text, x0, x1) runs in layout points. A page the probe skipped comes back
+# as its probe text instead, which still carries the Provider heading
+# (statements print it on the voucher summary page too).
+# Statement pages are landscape letter; x positions are scaled to this width
+LAYOUT_WIDTH = 792.0
+# Column cut points (x, in layout points) between the 23 statement columns:
+# Client | Suffix | Name | Rate Type | Quantity | Rate | Subtotal | Care Level |
+# Six Month Begin | Days Attended | Days Absent | Total Days Absent |
+# C1 Days Absent | Holidays | Approved Days | C1 Days | Gross Pay | Weekly Fee |
+# Fee Due | Total Net Adjusted Pay | Special Needs | Previously Paid | Difference Paid
+COLUMN_EDGES = [67.0, 81.5, 184.0, 200.0, 224.0, 254.0, 297.0, 313.0, 345.0, 363.0, 378.0, 395.0,
+                415.0, 434.0, 456.0, 485.0, 538.0, 560.0, 615.0, 665.0, 680.0, 731.0]
+NAME_COLUMN = 2
+# Characters whose tops are this close (points) are on the same line
+LINE_TOLERANCE = 2.0
+# A horizontal gap wider than this (points) starts a new run
+RUN_GAP = 1.0
+PROBE_RE = re.compile(r'(?m)^\s*\d{8}\s+\d{2}\b')
+CLIENT_RE = re.compile(r'^\d{8}$')
+SUFFIX_RE = re.compile(r'^\d{2}$')
+
+def has_client_line(text):
+    return PROBE_RE.search(text or "") is not None
+
+def page_lines(chars, page_width):
+    """Group (char, x0, x1, top) into lines of (text, x0, x1) runs, top to bottom"""
+    scale = LAYOUT_WIDTH / page_width if page_width else 1.0
+    lines = []
+    current = []
+    line_top = None
+    for char in sorted(chars, key=lambda c: (c[3], c[1])):
+        if line_top is None or abs(char[3] - line_top) > LINE_TOLERANCE:
+            if current:
+                lines.append(current)
+            current = []
+            line_top = char[3]
+        current.append(char)
+    if current:
+        lines.append(current)
+    return [line_runs(sorted(line, key=lambda c: c[1]), scale) for line in lines]
+
+def line_runs(chars, scale):
+    runs = []
+    text, x0, x1 = "", None, None
+    for char, char_x0, char_x1, _ in chars:
+        char_x0, char_x1 = char_x0 * scale, char_x1 * scale
+        new_run = (char.isspace() or x1 is None or char_x0 - x1 > RUN_GAP
+                   # "1.00$100.00": a currency sign glued to the previous value
+                   or (char == "$" and text[-1:].isdigit()))
+        if new_run and text:
+            runs.append((text, x0, x1))
+            text, x0 = "", None
+        if char.isspace():
+            x1 = char_x1
+            continue
+        if x0 is None:
+            x0 = char_x0
+        text += char
+        x1 = char_x1
+    if text:
+        runs.append((text, x0, x1))
+    return runs
+
+def line_text(runs):
+    return " ".join(text for text, _, _ in runs)
+
+def column_index(x0, x1):
+    centre = (x0 + x1) / 2
+    for index, edge in enumerate(COLUMN_EDGES):
+        if centre < edge:
+            return index
+    return len(COLUMN_EDGES)
+
+def parse_row(runs):
+    """Map a line's runs onto the 23 statement columns. Returns (row, rule)
+    like pdf_converter.parse_line: "full" when every column has a value,
+    "padded" when some are empty, (None, None) when client, suffix or name
+    is missing."""
+    cells = [[] for _ in range(len(COLUMN_EDGES) + 1)]
+    for text, x0, x1 in runs:
+        cells[column_index(x0, x1)].append(text)
+    row = [" ".join(cell) if index == NAME_COLUMN else "".join(cell) for index, cell in enumerate(cells)]
+    if not (CLIENT_RE.match(row[0]) and SUFFIX_RE.match(row[1]) and row[NAME_COLUMN]):
+        return None, None
+    return row, ("full" if all(row) else "padded")
+
+# Character readers: yield, per page of [start, stop), the probe text when
+# it has no client line, else (chars, page width) with chars as
+# (char, x0, x1, top) in top-down page coordinates. Like the text backends,
+# the PyMuPDF and PDFium readers hold their engine's lock per page.
+def pdfplumber_chars(pdf_path, start=0, stop=None):
+    import io
+    import pdfplumber
+    page_numbers = list(range(start + 1, stop + 1)) if stop is not None else None
+    source = pdf_input(pdf_path)
+    with pdfplumber.open(source if is_path(source) else io.BytesIO(source), pages=page_numbers) as pdf:
+        for page in (pdf.pages if page_numbers is not None else pdf.pages[start:]):
+            chars = [(c["text"], c["x0"], c["x1"], c["top"]) for c in page.chars]
+            width = page.width
+            page.close()
+            yield chars, width
+
+def pymupdf_chars(pdf_path, start=0, stop=None):
+    with mupdf_lock:
+        doc = open_pymupdf(pdf_path)
+        page_count = len(doc)
+    try:
+        for page_number in range(page_count)[start:stop]:
+            with mupdf_lock:
+                page = doc[page_number]
+                text = page.get_text()
+                blocks = page.get_text("rawdict")["blocks"] if has_client_line(text) else None
+                width = page.rect.width
+                del page
+            if blocks is None:
+                yield text
+                continue
+            chars = []
+            for block in blocks:
+                for line in block.get("lines", ()):
+                    for span in line["spans"]:
+                        for char in span["chars"]:
+                            x0, top, x1, _ = char["bbox"]
+                            chars.append((char["c"], x0, x1, top))
+            yield chars, width
+    finally:
+        with mupdf_lock:
+            doc.close()
+
+def pypdfium2_chars(pdf_path, start=0, stop=None):
+    import pypdfium2 as pdfium
+    with pdfium_lock:
+        doc = pdfium.PdfDocument(pdf_input(pdf_path))
+        page_count = len(doc)
+    try:
+        for page_number in range(page_count)[start:stop]:
+            with pdfium_lock:
+                page = doc[page_number]
+                textpage = page.get_textpage()
+                try:
+                    text = textpage.get_text_bounded().replace('\r\n', '\n').replace('\r', '\n')
+                    chars = None
+                    if has_client_line(text):
+                        width, height = page.get_size()
+                        count = textpage.count_chars()
+                        chars = []
+                        for index, char in enumerate(textpage.get_text_range(0, count)[:count]):
+                            if char in "\r\n":
+                                continue
+                            left, bottom, right, top = textpage.get_charbox(index, loose=True)
+                            chars.append((char, left, right, height - top))
+                finally:
+                    textpage.close()
+                    page.close()
+            yield text if chars is None else (chars, width)
+    finally:
+        with pdfium_lock:
+            doc.close()
+
+# Registry: text backend name -> character reader
+READERS = {
+    "pdfplumber": pdfplumber_chars,
+    "pymupdf": pymupdf_chars,
+    "pypdfium2": pypdfium2_chars,
+}
+
+def iter_page_lines(pdf_path, start=0, stop=None, backend=None):
+    """Lines of runs for every page of [start, stop), or the probe text of skipped pages"""
+    reader = READERS[backend or text_backends.default_backend]
+    for page in reader(pdf_path, start, stop):
+        if isinstance(page, str):
+            yield page
+            continue
+        lines = page_lines(*page)
+        text = "\n".join(line_text(runs) for runs in lines)
+        # Readers without a separate probe (pdfplumber) are probed here
+        yield lines if has_client_line(text) else text
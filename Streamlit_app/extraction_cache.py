@@ -0,0 +1,86 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+import uuid
+# Content-addressed cache of parsed PDF rows.
+# Entries are keyed on the SHA-256 of the PDF bytes plus the parser version
+# and text backend, and stored as gzipped JSON holding the parsed rows and the
+# detected provider name. The cache is bounded by total size and entry age;
+# the least recently used entries are evicted first.
+cache_dir = os.environ.get("PDF_CONVERTER_CACHE_DIR", ".extraction_cache")
+max_cache_bytes = int(os.environ.get("PDF_CONVERTER_CACHE_MAX_MB", "500")) * 1024 * 1024
+max_cache_age_days = float(os.environ.get("PDF_CONVERTER_CACHE_MAX_AGE_DAYS", "30"))
+# Hit/miss counters for the whole process (all sessions); per-run counts
+# are kept by the caller
+cache_stats = {"hits": 0, "misses": 0, "evicted": 0}
+# SHA-256 of a PDF given by path, or of its in-memory bytes
+def file_digest(pdf_path):
+    if not isinstance(pdf_path, (str, os.PathLike)):
+        return hashlib.sha256(pdf_path).hexdigest()
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+def cache_key(pdf_path, parser_version, backend):
+    return f"{file_digest(pdf_path)}-v{parser_version}-{backend}"
+def cache_path(key):
+    return os.path.join(cache_dir, f"{key}.json.gz")
+# Return (rows, provider_name) for a cached PDF, or None on a miss
+def load_cached(key):
+    path = cache_path(key)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        cache_stats["misses"] += 1
+        return None
+    # Touch the entry so eviction keeps recently used statements
+    os.utime(path)
+    cache_stats["hits"] += 1
+    return entry["rows"], entry["provider_name"]
+def store_cached(key, rows, provider_name):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(key)
+    # Unique per writer: concurrent jobs are threads of one process
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump({"provider_name": provider_name, "rows": rows}, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+# Drop entries older than the age limit, then the least recently used
+# entries until the cache fits in the size budget
+def evict_cache():
+    if not os.path.isdir(cache_dir):
+        return
+    now = time.time()
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if now - stat.st_mtime > max_cache_age_days * 86400:
+            if remove_entry(path):
+                cache_stats["evicted"] += 1
+        else:
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_cache_bytes:
+            break
+        if remove_entry(path):
+            cache_stats["evicted"] += 1
+        total_bytes -= size
+# Another job may evict the same entry at the same time
+def remove_entry(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+def report_cache_stats():
+    print(f":card_file_box: Extraction cache: {cache_stats['hits']} hits, "
+          f"{cache_stats['misses']} misses, {cache_stats['evicted']} evicted")
@@ -0,0 +1,50 @@
+import argparse
+import sys
+from backend_parity import describe_diff, describe_row, diff_rows, extract_rows
+from text_backends import BACKENDS, default_backend
+# Compare the "text" and "coordinates" extractors (see coordinate_extractor.py)
+# on the same PDFs: pages skipped by the probe, rows each one finds, rows only
+# the coordinates extractor recovers and rows it loses or reads differently.
+#   python extractor_parity.py input/*.pdf --backend pymupdf
+def compare_extractors(pdf_path, backend, max_report=20):
+    text_rows, text_provider, text_pages, text_time = extract_rows(pdf_path, backend, "text")
+    coord_rows, coord_provider, coord_pages, coord_time = extract_rows(pdf_path, backend, "coordinates")
+    skipped = sum(stats["skipped"] for stats in coord_pages)
+    print(f":page_facing_up: {pdf_path} ({backend})")
+    print(f"   text: {len(text_rows)} rows from {len(text_pages)} pages in {text_time:.2f}s, "
+          f"{sum(stats['padded'] for stats in text_pages)} padded, "
+          f"{sum(stats['rejected'] for stats in text_pages)} rejected")
+    print(f"   coordinates: {len(coord_rows)} rows from {len(coord_pages) - skipped} pages "
+          f"({skipped} skipped by the probe) in {coord_time:.2f}s, "
+          f"{sum(stats['padded'] for stats in coord_pages)} padded, "
+          f"{sum(stats['rejected'] for stats in coord_pages)} rejected")
+    # Rows found by one side only were lost (text only) or recovered
+    # (coordinates only) by the coordinates extractor
+    differing, lost, recovered = diff_rows(text_rows, coord_rows)
+    for row in recovered[:max_report]:
+        print(f"   :sparkles: {describe_row(row)} recovered by coordinates")
+    for row in lost[:max_report]:
+        print(f"   :x: {describe_row(row)} lost by coordinates")
+    for row, other in differing[:max_report]:
+        print(f"   :x: {describe_diff(row, other)}")
+    if text_provider != coord_provider:
+        print(f"   :x: Provider mismatch: {text_provider!r} != {coord_provider!r}")
+    matched = text_provider == coord_provider and not lost and not differing
+    if matched:
+        ratio = text_time / coord_time if coord_time else 0
+        print(f"   :white_tick: No rows lost, {len(recovered)} recovered (text/coordinates time ratio {ratio:.1f}x)")
+    else:
+        print(f"   :warning: {len(lost)} rows lost, {len(differing)} differ, {len(recovered)} recovered")
+    return matched
+def main():
+    parser = argparse.ArgumentParser(description="Diff parsed payment rows between the text and coordinates extractors.")
+    parser.add_argument("pdfs", nargs="+", help="PDF files to check")
+    parser.add_argument("--backend", default=default_backend, choices=list(BACKENDS),
+                        help=f"Text backend for both extractors (default: {default_backend})")
+    args = parser.parse_args()
+    all_matched = True
+    for pdf_path in args.pdfs:
+        all_matched &= compare_extractors(pdf_path, args.backend)
+    sys.exit(0 if all_matched else 1)
+if __name__ == "__main__":
+    main()
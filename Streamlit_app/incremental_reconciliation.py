@@ -0,0 +1,154 @@
+import hashlib
+import pandas as pd
+import metrics
+import payment_store
+import reconciliation
+# Incremental Compare Data.
+# A ReconciliationState remembers what the last run was computed from: the
+# attendance index and file hash, a hash of every provider's extracted rows
+# and of each of its case numbers' rows, and the results. The next run diffs
+# its inputs against that state and only recomputes what depends on a change:
+#   - attendance comparison and overpaid cases are per case, so only the
+#     changed case numbers of a provider are re-diffed and spliced into its
+#     previous results;
+#   - branch names, filtered and missing cases are recomputed for a provider
+#     when its rows, one of its cases, or one of its branches changed;
+#   - providers with no changed input are served from the previous run.
+PER_CASE_KEYS = ('attendance_comparison', 'overpaid_cases')
+PER_PROVIDER_KEYS = ('branch_names', 'filtered_cases', 'missing_cases')
+
+class ReconciliationState:
+    """Inputs and results of the last Compare Data run"""
+
+    def __init__(self, attendance_hash, index, provider_hashes, case_hashes, results):
+        self.attendance_hash = attendance_hash
+        self.index = index
+        self.provider_hashes = provider_hashes
+        self.case_hashes = case_hashes
+        self.results = results
+
+def frame_case_hashes(df):
+    """{case number: hash of that case's statement rows, in row order}"""
+    if df.empty:
+        return {}
+    row_hashes = pd.util.hash_pandas_object(df[payment_store.stored_columns].astype(str), index=False)
+    grouped = pd.Series(row_hashes.values).groupby(reconciliation.case_numbers(df).values, sort=False)
+    return {case_number: hash(tuple(group)) for case_number, group in grouped}
+
+def frame_hash(df):
+    row_hashes = pd.util.hash_pandas_object(df[payment_store.stored_columns].astype(str), index=False)
+    return hashlib.sha256(row_hashes.values.tobytes()).hexdigest()
+
+def changed_keys(old, new):
+    """Keys whose value differs between two dicts, or that are in only one"""
+    return {key for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
+
+def group_signatures(pairs, key, value):
+    """{key: hash of its value column in row order} of a (Case number, Branch) frame"""
+    numbered = pairs[[key, value]].assign(position=pairs.groupby(key, sort=False).cumcount())
+    row_hashes = pd.util.hash_pandas_object(numbered, index=False)
+    return row_hashes.groupby(numbered[key].values, sort=False).sum()
+
+def changed_groups(old_pairs, new_pairs, key, value):
+    """Values of key whose value column, in row order, differs between two
+    (Case number, Branch) frames"""
+    old = group_signatures(old_pairs, key, value)
+    new = group_signatures(new_pairs, key, value)
+    common = old.index.intersection(new.index)
+    differs = common[old[common].values != new[common].values]
+    return set(old.index.symmetric_difference(new.index)) | set(differs)
+
+def attendance_changes(old_index, new_index):
+    """(changed case numbers, changed branches) between two attendance indexes"""
+    old_sums = dict(zip(old_index.case_sums['Case number'], old_index.case_sums['Attendance']))
+    new_sums = dict(zip(new_index.case_sums['Case number'], new_index.case_sums['Attendance']))
+    old_pairs, new_pairs = old_index.case_branch_pairs, new_index.case_branch_pairs
+    cases = changed_keys(old_sums, new_sums) | changed_groups(old_pairs, new_pairs, 'Case number', 'Branch')
+    branches = changed_groups(old_pairs, new_pairs, 'Branch', 'Case number')
+    return {str(case).strip() for case in cases}, branches
+
+def splice(previous, recomputed, changed_cases):
+    """Previous per-case results with the changed cases replaced, in the
+    Case number order a full run produces"""
+    kept = previous[~previous['Case number'].isin(changed_cases)]
+    spliced = pd.concat([kept, recomputed], ignore_index=True) if len(recomputed) else kept
+    return spliced.sort_values('Case number', kind='stable').reset_index(drop=True)
+
+def reconcile_incremental(index, attendance_hash, provider_frames, previous=None):
+    """Compare Data against the previous run's state.
+
+    Returns (results, errors, state, plan): results and errors as from
+    reconciliation.reconcile, the new ReconciliationState, and plan mapping
+    provider -> "reused", "cases" (only changed cases re-diffed) or "full".
+    """
+    provider_hashes = {provider: frame_hash(df) for provider, df in provider_frames.items()}
+    if previous is None:
+        results, errors = reconciliation.reconcile(index, provider_frames)
+        case_hashes = {provider: frame_case_hashes(df) for provider, df in provider_frames.items()}
+        state = ReconciliationState(attendance_hash, index, provider_hashes, case_hashes, results) if not errors else None
+        return results, errors, state, dict.fromkeys(provider_frames, "full")
+    if attendance_hash != previous.attendance_hash:
+        attendance_cases, attendance_branches = attendance_changes(previous.index, index)
+    else:
+        attendance_cases, attendance_branches = set(), set()
+    results = {}
+    plan = {}
+    case_hashes = {}
+    full_frames = {}
+    branch_frames = {}
+    per_case_frames = {}
+    changed_by_provider = {}
+    for provider, df in provider_frames.items():
+        if provider not in previous.results:
+            full_frames[provider] = df
+            case_hashes[provider] = frame_case_hashes(df)
+            plan[provider] = "full"
+            continue
+        if provider_hashes[provider] == previous.provider_hashes.get(provider):
+            case_hashes[provider] = previous.case_hashes[provider]
+            data_cases = set()
+        else:
+            case_hashes[provider] = frame_case_hashes(df)
+            data_cases = changed_keys(previous.case_hashes[provider], case_hashes[provider])
+        provider_cases = previous.case_hashes[provider].keys() | case_hashes[provider].keys()
+        changed = data_cases | (attendance_cases & provider_cases)
+        branches = previous.results[provider].get('branch_names')
+        branch_changed = branches is not None and bool(attendance_branches & set(branches['Branch']))
+        if not changed and not branch_changed:
+            results[provider] = previous.results[provider]
+            plan[provider] = "reused"
+            continue
+        results[provider] = dict(previous.results[provider])
+        plan[provider] = "cases"
+        if changed:
+            changed_by_provider[provider] = changed
+            per_case_frames[provider] = df[reconciliation.case_numbers(df).isin(changed).values]
+        # Branch-level analyses depend on the provider's whole case list
+        branch_frames[provider] = df
+    errors = {}
+    if full_frames:
+        full_results, full_errors = reconciliation.reconcile(index, full_frames)
+        errors.update(full_errors)
+        results.update(full_results)
+    if branch_frames:
+        branch_results, branch_errors = reconciliation.reconcile(index, branch_frames, keys=PER_PROVIDER_KEYS)
+        errors.update(branch_errors)
+        for provider, provider_results in branch_results.items():
+            for key in PER_PROVIDER_KEYS:
+                results[provider][key] = provider_results[key]
+    if per_case_frames:
+        case_results, case_errors = reconciliation.reconcile(index, per_case_frames, keys=PER_CASE_KEYS)
+        errors.update(case_errors)
+        for provider, provider_results in case_results.items():
+            for key in PER_CASE_KEYS:
+                previous_df = results[provider][key]
+                if previous_df is None or provider_results[key] is None:
+                    continue
+                results[provider][key] = splice(previous_df, provider_results[key], changed_by_provider[provider])
+    if errors:
+        # Fall back to a clean full run rather than keep a partly updated state
+        return reconcile_incremental(index, attendance_hash, provider_frames)
+    results = {provider: results[provider] for provider in provider_frames}
+    metrics.count('reused_providers', sum(action == "reused" for action in plan.values()))
+    state = ReconciliationState(attendance_hash, index, provider_hashes, case_hashes, results)
+    return results, errors, state, plan
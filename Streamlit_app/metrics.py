@@ -0,0 +1,203 @@
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager
+# Lightweight run instrumentation for the converter and Compare Data.
+# Code under `with metrics.recording(run):` reports stage timings, counters
+# and per-page parse results to `run` (a RunMetrics); outside of it every
+# call here is a no-op. The active run lives in a context variable, so the
+# background conversion threads of different sessions never mix.
+# Memory is reported per run as the growth of the process's resident memory
+# over its level when the run started, sampled at every stage and page. The
+# server's lifetime peak (ru_maxrss) would only reflect its largest run ever.
+#   with metrics.recording() as run:
+#       pdf_converter.convert_pdfs(...)
+#   run.write_json("metrics.json"); run.write_prometheus("caretaker.prom")
+PROMETHEUS_PREFIX = "caretaker"
+RULES = ("full", "padded", "rejected")
+_current = contextvars.ContextVar("metrics_run", default=None)
+
+class RunMetrics:
+    """Timings, counters and parse results collected during one run"""
+
+    def __init__(self, name="run"):
+        self.name = name
+        self.started = time.time()
+        self.finished = None
+        # stage -> {"seconds": total, "calls": n}
+        self.stages = {}
+        self.counters = {}
+        # file -> page/row/rule counts and extract/parse seconds
+        self.files = {}
+        # One dict per page: file, page, rows, rule counts, seconds
+        self.pages = []
+        # Resident memory when the run started, at its sampled peak and at its end
+        self.rss_start = None
+        self.rss_peak = None
+        self.rss_end = None
+
+    def begin(self):
+        self.rss_start = self.rss_peak = current_rss_bytes()
+
+    def sample_memory(self):
+        rss = current_rss_bytes()
+        if rss is not None and self.rss_peak is not None and rss > self.rss_peak:
+            self.rss_peak = rss
+        return rss
+
+    def memory_delta(self, rss):
+        return rss - self.rss_start if rss is not None and self.rss_start is not None else None
+
+    def add_stage(self, stage, seconds, calls=1):
+        entry = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+        entry["seconds"] += seconds
+        entry["calls"] += calls
+        self.sample_memory()
+
+    def add_count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_page(self, filename, page_stats):
+        page = dict(page_stats, file=filename)
+        self.pages.append(page)
+        totals = self.files.setdefault(filename, dict(
+            {"pages": 0, "pages_skipped": 0, "rows": 0, "extract_seconds": 0.0, "parse_seconds": 0.0},
+            **dict.fromkeys(RULES, 0)))
+        totals["pages"] += 1
+        totals["pages_skipped"] += page.get("skipped", 0)
+        for key in ("rows", "extract_seconds", "parse_seconds") + RULES:
+            totals[key] += page.get(key, 0)
+        self.add_stage("extract_text", page.get("extract_seconds", 0.0))
+        self.add_stage("parse", page.get("parse_seconds", 0.0))
+
+    def finish(self):
+        self.finished = time.time()
+        self.rss_end = self.sample_memory()
+        return self
+
+    def parse_rates(self):
+        """file -> share of client lines parsed fully, padded (fallback) and rejected"""
+        rates = {}
+        for filename, totals in self.files.items():
+            lines = sum(totals[rule] for rule in RULES)
+            rates[filename] = {rule: (totals[rule] / lines if lines else 0.0) for rule in RULES}
+        return rates
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "started": self.started,
+            "finished": self.finished,
+            "seconds": (self.finished or time.time()) - self.started,
+            "rss_start_bytes": self.rss_start,
+            "peak_rss_delta_bytes": self.memory_delta(self.rss_peak),
+            "rss_delta_bytes": self.memory_delta(self.rss_end),
+            "stages": self.stages,
+            "counters": self.counters,
+            "files": self.files,
+            "parse_rates": self.parse_rates(),
+            "pages": self.pages,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        """Prometheus text exposition format, for node_exporter's textfile collector"""
+        prefix = f"{PROMETHEUS_PREFIX}_"
+        run = {"run": self.name}
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f"# HELP {prefix}{name} {help_text}")
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{escape_label(val)}"' for key, val in dict(run, **labels).items())
+                lines.append(f"{prefix}{name}{{{label_text}}} {value}")
+
+        run_info = self.to_dict()
+        metric("run_seconds", "Wall time of the run.", [({}, run_info["seconds"])])
+        if run_info["peak_rss_delta_bytes"] is not None:
+            metric("peak_rss_delta_bytes", "Peak growth of resident memory during the run.",
+                   [({}, run_info["peak_rss_delta_bytes"])])
+            metric("rss_delta_bytes", "Resident memory at the end of the run minus at its start.",
+                   [({}, run_info["rss_delta_bytes"])])
+        metric("stage_seconds", "Time spent per stage.",
+               [({"stage": stage}, entry["seconds"]) for stage, entry in self.stages.items()])
+        metric("stage_calls", "Calls per stage.",
+               [({"stage": stage}, entry["calls"]) for stage, entry in self.stages.items()])
+        for name, value in self.counters.items():
+            metric(name, f"Counter {name}.", [({}, value)])
+        metric("file_pages", "Pages read per file.",
+               [({"file": filename}, totals["pages"]) for filename, totals in self.files.items()])
+        metric("file_pages_skipped", "Pages skipped by the client line probe per file.",
+               [({"file": filename}, totals["pages_skipped"]) for filename, totals in self.files.items()])
+        metric("file_rows", "Payment rows parsed per file.",
+               [({"file": filename}, totals["rows"]) for filename, totals in self.files.items()])
+        metric("parse_lines", "Client lines per file by parse outcome (full, padded fallback, rejected).",
+               [({"file": filename, "rule": rule}, totals[rule])
+                for filename, totals in self.files.items() for rule in RULES])
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        write_atomic(path, self.to_json())
+
+    def write_prometheus(self, path):
+        # The textfile collector may read at any time, so replace atomically
+        write_atomic(path, self.to_prometheus())
+
+def current_rss_bytes():
+    """Resident memory of the process now, or None where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def recording(run=None):
+    """Make `run` (a new RunMetrics by default) the active run for the with-block"""
+    run = run if run is not None else RunMetrics()
+    run.begin()
+    token = _current.set(run)
+    try:
+        yield run
+    finally:
+        _current.reset(token)
+        run.finish()
+
+def current():
+    return _current.get()
+
+@contextmanager
+def stage(name):
+    """Time the with-block as `name` in the active run, if any"""
+    run = _current.get()
+    if run is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        run.add_stage(name, time.perf_counter() - started)
+
+def count(name, value=1):
+    run = _current.get()
+    if run is not None:
+        run.add_count(name, value)
+
+def record_page(filename, page_stats):
+    run = _current.get()
+    if run is not None:
+        run.add_page(filename, page_stats)
@@ -0,0 +1,231 @@
+import argparse
+import io
+import os
+import re
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+# Columnar store for converted payment rows.
+# Each provider is a partition of a Parquet dataset under the output directory:
+#   output/provider=<Provider name>/part-0.parquet
+# Streaming runs add further part-*.parquet files to the partition; readers
+# treat every part file in the partition as that provider's data.
+# Money, day and count columns are stored as numbers; Excel is only produced
+# on demand by export_excel() / provider_excel_bytes().
+OUTPUT_DIR = "output"
+# The 23 columns of a statement's payment line, plus the statement period
+# ("YYYY-MM") the line was listed under
+statement_columns = [
+    "Client", "Suffix", "Name", "Rate Type", "Quantity", "Rate", "Subtotal", "Care Level",
+    "Six Month Begin", "Days Attended", "Days Absent", "Total Days Absent", "C1 Days Absent",
+    "Holidays", "Approved Days", "C1 Days", "Gross Pay", "Weekly Fee", "Fee Due",
+    "Total Net Adjusted Pay", "Special Needs", "Previously Paid", "Difference Paid"
+]
+columns = statement_columns + ["Paid Period"]
+# Flags printed after a day count (the "*" of "19*") are stored apart from
+# the number, as "<column>=<flag>" entries joined by "; ", so the count
+# stays numeric and the Excel export can print the value as it was parsed
+FLAGS_COLUMN = "Day Flags"
+stored_columns = columns + [FLAGS_COLUMN]
+DAY_VALUE_RE = r'^(\d*)(.*)$'
+currency_cols = ["Rate", "Subtotal", "Gross Pay", "Fee Due", "Total Net Adjusted Pay", "Previously Paid", "Difference Paid"]
+numeric_cols = ["Quantity", "Weekly Fee"]
+day_cols = ["Days Attended", "Days Absent", "Total Days Absent", "C1 Days Absent", "Holidays", "Approved Days", "C1 Days"]
+SCHEMA = pa.schema(
+    [(col, pa.float64()) if col in currency_cols + numeric_cols
+     else (col, pa.int64()) if col in day_cols
+     else (col, pa.string())
+     for col in stored_columns]
+)
+# Define formatting functions
+def format_currency(val):
+    try:
+        return "${:,.2f}".format(float(str(val).replace('$', '').replace(',', '')))
+    except:
+        return val
+def format_number(val):
+    try:
+        return "{:.2f}".format(float(val))
+    except:
+        return val
+def safe_name(provider):
+    return re.sub(r'[\\/*?:"<>|]', "_", provider)
+def partition_dir(provider, output_dir=OUTPUT_DIR):
+    return os.path.join(output_dir, f"provider={safe_name(provider)}")
+def partition_path(provider, output_dir=OUTPUT_DIR):
+    return os.path.join(partition_dir(provider, output_dir), "part-0.parquet")
+def part_files(provider, output_dir=OUTPUT_DIR):
+    path = partition_dir(provider, output_dir)
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+                  if name.startswith("part-") and name.endswith(".parquet"))
+# Convert parsed string rows into a typed frame. A day count is split into
+# its leading digits, stored as the number, and whatever follows (e.g. the
+# "*" of a flagged "17*"), kept in FLAGS_COLUMN.
+def typed_frame(rows):
+    df = pd.DataFrame(rows, columns=columns)
+    for col in currency_cols:
+        df[col] = pd.to_numeric(df[col].str.replace(r'[\$,]', '', regex=True), errors='coerce').astype("float64")
+    for col in numeric_cols:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype("float64")
+    flags = pd.Series("", index=df.index)
+    for col in day_cols:
+        parts = df[col].fillna("").astype(str).str.strip().str.extract(DAY_VALUE_RE)
+        df[col] = pd.to_numeric(parts[0], errors='coerce').astype("Int64")
+        flagged = parts[1] != ""
+        flags[flagged] = flags[flagged] + "; " + col + "=" + parts[1][flagged]
+    df[FLAGS_COLUMN] = flags.str.removeprefix("; ")
+    return df
+# Rows whose day column col carried a flag
+def flagged(df, col):
+    if FLAGS_COLUMN not in df.columns:
+        return pd.Series(False, index=df.index)
+    return df[FLAGS_COLUMN].fillna("").str.contains(f"(?:^|; ){col}=", regex=True)
+# Parquet hands back day columns as int64 or float64 depending on nulls;
+# always use the nullable Int64 that typed_frame() produces. Partitions
+# written before FLAGS_COLUMN existed read back with no flags.
+def with_dtypes(df):
+    for col in day_cols:
+        if col in df.columns:
+            df[col] = df[col].astype("Int64")
+    if FLAGS_COLUMN in df.columns:
+        df[FLAGS_COLUMN] = df[FLAGS_COLUMN].fillna("")
+    elif set(columns) <= set(df.columns):
+        df[FLAGS_COLUMN] = ""
+    return df
+# Write a provider's rows, appending to (and de-duplicating against) any
+# rows already stored for that provider. Returns the stored frame and the
+# number of new rows.
+def write_provider(provider, df, output_dir=OUTPUT_DIR):
+    path = partition_path(provider, output_dir)
+    existing_parts = part_files(provider, output_dir)
+    df = df.drop_duplicates()
+    if existing_parts:
+        existing_df = read_provider(provider, output_dir=output_dir).drop_duplicates()
+        combined_df = pd.concat([existing_df, df], ignore_index=True).drop_duplicates()
+        added = len(combined_df) - len(existing_df)
+    else:
+        combined_df = df
+        added = len(df)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(combined_df, schema=SCHEMA, preserve_index=False)
+    pq.write_table(table, path)
+    # Streamed parts are now folded into part-0
+    for part in existing_parts:
+        if part != path:
+            os.remove(part)
+    return combined_df.reset_index(drop=True), added
+# Changes whenever a provider's part files are written, for cache keys
+def partition_signature(provider, output_dir=OUTPUT_DIR):
+    signature = []
+    for part in part_files(provider, output_dir):
+        stat = os.stat(part)
+        signature.append((os.path.basename(part), stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+def list_providers(output_dir=OUTPUT_DIR):
+    if not os.path.isdir(output_dir):
+        return []
+    return sorted(name[len("provider="):] for name in os.listdir(output_dir)
+                  if name.startswith("provider=") and part_files(name[len("provider="):], output_dir))
+def read_provider(provider, usecols=None, output_dir=OUTPUT_DIR):
+    tables = [pq.read_table(part, columns=usecols, partitioning=None) for part in part_files(provider, output_dir)]
+    # Parts written before FLAGS_COLUMN existed lack it; promotion fills nulls
+    return with_dtypes(pa.concat_tables(tables, promote_options="default").to_pandas())
+# Chunked writer for streaming conversions. Rows are buffered per provider;
+# once chunk_rows rows are buffered in total, every buffer is written out as
+# a Parquet row group of a new part file, so memory stays bounded by the
+# chunk size rather than the document length.
+# Rows already stored (or already written this run) are skipped, using a set
+# of 64-bit row hashes per provider.
+class ChunkedProviderWriter:
+    def __init__(self, output_dir=OUTPUT_DIR, chunk_rows=2000):
+        self.output_dir = output_dir
+        self.chunk_rows = chunk_rows
+        self.buffered = 0
+        self.buffers = {}
+        self.writers = {}
+        self.seen = {}
+        self.rows_written = {}
+    def add(self, provider, rows):
+        self.buffers.setdefault(provider, []).extend(rows)
+        self.buffered += len(rows)
+        if self.buffered >= self.chunk_rows:
+            for buffered_provider in list(self.buffers):
+                self.flush(buffered_provider)
+    def existing_hashes(self, provider):
+        hashes = set()
+        for part in part_files(provider, self.output_dir):
+            for batch in pq.ParquetFile(part).iter_batches(batch_size=self.chunk_rows):
+                hashes.update(pd.util.hash_pandas_object(with_dtypes(batch.to_pandas()), index=False).tolist())
+        return hashes
+    def flush(self, provider):
+        rows = self.buffers.get(provider)
+        if not rows:
+            return
+        self.buffers[provider] = []
+        self.buffered -= len(rows)
+        if provider not in self.seen:
+            self.seen[provider] = self.existing_hashes(provider)
+        seen = self.seen[provider]
+        df = typed_frame(rows)
+        keep = []
+        for row_hash in pd.util.hash_pandas_object(df, index=False).tolist():
+            keep.append(row_hash not in seen)
+            seen.add(row_hash)
+        df = df[keep]
+        if df.empty:
+            return
+        if provider not in self.writers:
+            path = os.path.join(partition_dir(provider, self.output_dir), f"part-{uuid.uuid4().hex}.parquet")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.writers[provider] = pq.ParquetWriter(path, SCHEMA)
+        self.writers[provider].write_table(pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False))
+        self.rows_written[provider] = self.rows_written.get(provider, 0) + len(df)
+    # Flush remaining rows and close the part files; returns {provider: new rows}
+    def close(self):
+        for provider in list(self.buffers):
+            self.flush(provider)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+        return dict(self.rows_written)
+# Excel export: same layout and formatting the converter used to write
+def excel_frame(df):
+    df = df.copy()
+    for col in currency_cols:
+        df[col] = df[col].map(format_currency).where(df[col].notna(), "")
+    for col in numeric_cols:
+        df[col] = df[col].map(format_number).where(df[col].notna(), "")
+    if FLAGS_COLUMN in df.columns:
+        # Print flagged day counts as parsed, e.g. "19*", one column at a time
+        flags_text = df[FLAGS_COLUMN].fillna("")
+        for col in day_cols:
+            flags = flags_text.str.extract(f"(?:^|; ){re.escape(col)}=(.*?)(?:; |$)")[0]
+            mask = flags.notna()
+            if mask.any():
+                df[col] = df[col].astype(object)
+                df.loc[mask, col] = df.loc[mask, col].fillna("").astype(str) + flags[mask]
+        df = df.drop(columns=[FLAGS_COLUMN])
+    return df
+def provider_excel_bytes(provider, output_dir=OUTPUT_DIR):
+    buffer = io.BytesIO()
+    excel_frame(read_provider(provider, output_dir=output_dir)).to_excel(buffer, index=False)
+    return buffer.getvalue()
+def export_excel(provider, dest_dir=None, output_dir=OUTPUT_DIR):
+    dest_dir = dest_dir or output_dir
+    os.makedirs(dest_dir, exist_ok=True)
+    excel_path = os.path.join(dest_dir, f"{safe_name(provider)}.xlsx")
+    excel_frame(read_provider(provider, output_dir=output_dir)).to_excel(excel_path, index=False)
+    return excel_path
+def main():
+    parser = argparse.ArgumentParser(description="Export converted payment data to Excel.")
+    parser.add_argument("providers", nargs="*", help="Providers to export (default: all)")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="Parquet store directory")
+    parser.add_argument("--dest", default=None, help="Destination directory (default: the store directory)")
+    args = parser.parse_args()
+    for provider in args.providers or list_providers(args.output_dir):
+        print(f":file_folder: Exported '{provider}' to '{export_excel(provider, args.dest, args.output_dir)}'")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import argparse
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+import pandas as pd
+import metrics
+import payment_store
+# Historical payment warehouse: one SQLite file that outlives sessions and
+# workspaces, so questions can be asked across statement periods.
+#   payments       every converted statement line, keyed by provider and a
+#                  hash of the line (re-loading a statement adds nothing)
+#   case_periods   per provider, case number and paid period: paid days,
+#                  approved days, gross and net pay; kept up to date on load
+#   attendance     per attendance period and case number: total attendance
+#                  and the branches it was recorded under; a re-uploaded
+#                  export replaces its period
+#   underpaid      case periods whose attendance exceeds the paid days
+#   provider_periods  cases, paid days and pay per provider and period
+# The last two are derived tables, refreshed for the periods a load touches,
+# so cross-period questions read a few thousand rows instead of every line.
+# All lookups go through indexes on provider, case number and period.
+#   python payment_warehouse.py --output-dir output --attendance march.xlsx
+#   python payment_warehouse.py --case 40606786/05
+#   python payment_warehouse.py --underpaid-branches --min-periods 2
+warehouse_path = os.environ.get("CARETAKER_WAREHOUSE_PATH", "payment_warehouse.sqlite")
+
+def column_name(col):
+    """SQL column for a payment_store column: "Days Attended" -> days_attended"""
+    return col.lower().replace(" ", "_")
+
+def sql_type(col):
+    if col in payment_store.currency_cols + payment_store.numeric_cols:
+        return "REAL"
+    if col in payment_store.day_cols:
+        return "INTEGER"
+    return "TEXT"
+
+SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS payments (
+        provider TEXT NOT NULL,
+        case_number TEXT NOT NULL,
+        {", ".join(f"{column_name(col)} {sql_type(col)}" for col in payment_store.stored_columns)},
+        row_hash INTEGER NOT NULL,
+        loaded_at REAL NOT NULL,
+        PRIMARY KEY (provider, row_hash)
+    )""",
+    "CREATE INDEX IF NOT EXISTS payments_provider_case_period ON payments (provider, case_number, paid_period)",
+    "CREATE INDEX IF NOT EXISTS payments_case_period ON payments (case_number, paid_period)",
+    """CREATE TABLE IF NOT EXISTS case_periods (
+        provider TEXT NOT NULL,
+        case_number TEXT NOT NULL,
+        paid_period TEXT NOT NULL,
+        name TEXT,
+        rate REAL,
+        days_attended INTEGER,
+        approved_days INTEGER,
+        gross_pay REAL,
+        net_pay REAL,
+        lines INTEGER NOT NULL,
+        PRIMARY KEY (provider, case_number, paid_period)
+    )""",
+    "CREATE INDEX IF NOT EXISTS case_periods_case_period ON case_periods (case_number, paid_period)",
+    "CREATE INDEX IF NOT EXISTS case_periods_period ON case_periods (paid_period, provider)",
+    """CREATE TABLE IF NOT EXISTS attendance (
+        period TEXT NOT NULL,
+        case_number TEXT NOT NULL,
+        branch TEXT,
+        attendance REAL,
+        source_hash TEXT NOT NULL,
+        PRIMARY KEY (period, case_number)
+    )""",
+    "CREATE INDEX IF NOT EXISTS attendance_case_period ON attendance (case_number, period)",
+    "CREATE INDEX IF NOT EXISTS attendance_branch_period ON attendance (branch, period)",
+    """CREATE TABLE IF NOT EXISTS underpaid (
+        provider TEXT NOT NULL,
+        case_number TEXT NOT NULL,
+        period TEXT NOT NULL,
+        branch TEXT,
+        attendance REAL,
+        paid_days INTEGER,
+        unpaid_days REAL,
+        unpaid_amount REAL,
+        PRIMARY KEY (provider, case_number, period)
+    )""",
+    "CREATE INDEX IF NOT EXISTS underpaid_case_period ON underpaid (case_number, period)",
+    "CREATE INDEX IF NOT EXISTS underpaid_period ON underpaid (period)",
+    """CREATE TABLE IF NOT EXISTS provider_periods (
+        provider TEXT NOT NULL,
+        paid_period TEXT NOT NULL,
+        cases INTEGER,
+        days_attended INTEGER,
+        gross_pay REAL,
+        net_pay REAL,
+        PRIMARY KEY (paid_period, provider)
+    )""",
+    """CREATE TABLE IF NOT EXISTS attendance_uploads (
+        source_hash TEXT PRIMARY KEY,
+        period TEXT NOT NULL,
+        cases INTEGER NOT NULL,
+        loaded_at REAL NOT NULL
+    )""",
+]
+
+@contextmanager
+def connect(path=None):
+    """Open the warehouse (creating it if needed); commits on success"""
+    path = path or warehouse_path
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with closing(sqlite3.connect(path, timeout=30)) as conn:
+        # Readers are not blocked by a session that is loading statements
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        if "day_flags" not in {row[1] for row in conn.execute("PRAGMA table_info(payments)")}:
+            # Warehouses created before day flags were stored
+            conn.execute("ALTER TABLE payments ADD COLUMN day_flags TEXT")
+        with conn:
+            yield conn
+
+def payment_records(provider, df):
+    """Rows to insert for one provider's converted frame"""
+    df = df[payment_store.stored_columns]
+    # Hashed without the day flags, so lines loaded before they were stored
+    # keep their identity
+    row_hashes = pd.util.hash_pandas_object(df[payment_store.columns].astype(str), index=False).values.view("int64")
+    values = df.astype(object).where(df.notna(), None)
+    case_numbers = (df['Client'].astype(str) + '/' + df['Suffix'].astype(str)).tolist()
+    loaded_at = time.time()
+    for case_number, row, row_hash in zip(case_numbers, values.itertuples(index=False, name=None), row_hashes):
+        # An empty period means the line had no "Paid Period" heading
+        row = tuple(value if value != "" else None for value in row)
+        yield (provider, case_number) + row + (int(row_hash), loaded_at)
+
+def refresh_case_periods(conn, provider, periods):
+    """Recompute a provider's case_periods and provider_periods rows of the
+    given periods from payments"""
+    for period in periods:
+        conn.execute("DELETE FROM case_periods WHERE provider = ? AND paid_period = ?", (provider, period))
+        conn.execute("""
+            INSERT INTO case_periods
+            SELECT provider, case_number, paid_period, MIN(name), MAX(rate), SUM(days_attended), SUM(approved_days),
+                   SUM(gross_pay), SUM(total_net_adjusted_pay), COUNT(*)
+            FROM payments WHERE provider = ? AND paid_period = ?
+            GROUP BY case_number""", (provider, period))
+        conn.execute("""
+            INSERT OR REPLACE INTO provider_periods
+            SELECT provider, paid_period, COUNT(*), SUM(days_attended), SUM(gross_pay), SUM(net_pay)
+            FROM case_periods WHERE provider = ? AND paid_period = ?""", (provider, period))
+
+def refresh_underpaid(conn, period):
+    """Recompute the underpaid case periods (attendance above paid days) of a period"""
+    conn.execute("DELETE FROM underpaid WHERE period = ?", (period,))
+    conn.execute("""
+        INSERT INTO underpaid
+        SELECT c.provider, c.case_number, c.paid_period, a.branch, a.attendance, c.days_attended,
+               a.attendance - c.days_attended, (a.attendance - c.days_attended) * c.rate
+        FROM attendance a JOIN case_periods c ON c.case_number = a.case_number AND c.paid_period = a.period
+        WHERE a.period = ? AND a.attendance > c.days_attended""", (period,))
+
+def add_payments(provider_frames, path=None):
+    """Load converted statement rows ({provider: DataFrame}); returns the
+    number of lines that were not in the warehouse yet"""
+    column_list = ", ".join(["provider", "case_number"] + [column_name(col) for col in payment_store.stored_columns]
+                            + ["row_hash", "loaded_at"])
+    placeholders = ", ".join("?" * (len(payment_store.stored_columns) + 4))
+    added = 0
+    touched_periods = set()
+    with metrics.stage('warehouse_payments'), connect(path) as conn:
+        for provider, df in provider_frames.items():
+            if df is None or df.empty:
+                continue
+            before = conn.total_changes
+            conn.executemany(f"INSERT OR IGNORE INTO payments ({column_list}) VALUES ({placeholders})",
+                             payment_records(provider, df))
+            provider_added = conn.total_changes - before
+            if provider_added:
+                periods = [period for period in df['Paid Period'].dropna().unique() if period != ""]
+                refresh_case_periods(conn, provider, periods)
+                touched_periods.update(periods)
+            added += provider_added
+        for period in sorted(touched_periods):
+            refresh_underpaid(conn, period)
+    metrics.count('warehouse_lines_added', added)
+    return added
+
+def rebuild(path=None):
+    """Recompute every derived table from payments and attendance"""
+    with connect(path) as conn:
+        pairs = conn.execute("SELECT DISTINCT provider, paid_period FROM payments WHERE paid_period IS NOT NULL").fetchall()
+        conn.execute("DELETE FROM provider_periods")
+        for provider, period in pairs:
+            refresh_case_periods(conn, provider, [period])
+        for (period,) in conn.execute("SELECT DISTINCT paid_period FROM case_periods").fetchall():
+            refresh_underpaid(conn, period)
+
+def has_attendance(source_hash, path=None):
+    with connect(path) as conn:
+        return conn.execute("SELECT 1 FROM attendance_uploads WHERE source_hash = ?", (source_hash,)).fetchone() is not None
+
+def add_attendance(attendance_df, period, source_hash, path=None):
+    """Load a normalized attendance table (attendance_loader) as `period`
+    ("YYYY-MM"), replacing what an earlier export stored for that period"""
+    clean = attendance_df.dropna(subset=['Case number'])
+    totals = clean.groupby('Case number', observed=True).agg(
+        attendance=('Attendance', 'sum'),
+        branch=('Branch', lambda branches: ", ".join(sorted({str(branch) for branch in branches.dropna()})) or None),
+    )
+    with metrics.stage('warehouse_attendance'), connect(path) as conn:
+        conn.execute("DELETE FROM attendance WHERE period = ?", (period,))
+        conn.executemany(
+            "INSERT INTO attendance (period, case_number, branch, attendance, source_hash) VALUES (?, ?, ?, ?, ?)",
+            ((period, str(case_number), row.branch, float(row.attendance), source_hash)
+             for case_number, row in totals.iterrows()))
+        conn.execute("INSERT OR REPLACE INTO attendance_uploads VALUES (?, ?, ?, ?)",
+                     (source_hash, period, len(totals), time.time()))
+        refresh_underpaid(conn, period)
+    return len(totals)
+
+def query(sql, params=(), path=None):
+    with connect(path) as conn:
+        return pd.read_sql_query(sql, conn, params=params)
+
+def periods(path=None):
+    """Every statement or attendance period in the warehouse, newest first"""
+    return query("""
+        SELECT period FROM (SELECT DISTINCT paid_period AS period FROM provider_periods
+                            UNION SELECT period FROM attendance_uploads)
+        ORDER BY period DESC""", path=path)['period'].tolist()
+
+def case_history(case_number, since=None, path=None):
+    """Per period: what each provider was paid for a case against its attendance"""
+    return query("""
+        SELECT COALESCE(c.paid_period, a.period) AS "Period", c.provider AS "Provider", c.name AS "Name",
+               a.branch AS "Branch", a.attendance AS "Attendance", c.days_attended AS "Paid Days Attended",
+               c.approved_days AS "Approved Days", c.rate AS "Rate", c.gross_pay AS "Gross Pay",
+               c.net_pay AS "Net Pay", a.attendance - c.days_attended AS "Unpaid Days"
+        FROM case_periods c LEFT JOIN attendance a ON a.case_number = c.case_number AND a.period = c.paid_period
+        WHERE c.case_number = :case AND c.paid_period >= :since
+        UNION ALL
+        SELECT a.period, NULL, NULL, a.branch, a.attendance, NULL, NULL, NULL, NULL, NULL, NULL
+        FROM attendance a
+        WHERE a.case_number = :case AND a.period >= :since
+          AND NOT EXISTS (SELECT 1 FROM case_periods c WHERE c.case_number = a.case_number AND c.paid_period = a.period)
+        ORDER BY 1, 2""", {"case": case_number.strip(), "since": since or ""}, path)
+
+# Underpaid case periods since :since, of cases underpaid in at least
+# :min_periods periods
+UNDERPAID_SQL = """
+    WITH recent AS (
+        SELECT * FROM underpaid WHERE period >= :since
+    ), repeat AS (
+        SELECT * FROM recent WHERE case_number IN (
+            SELECT case_number FROM recent GROUP BY case_number HAVING COUNT(DISTINCT period) >= :min_periods)
+    )"""
+
+def repeat_underpayments(min_periods=2, since=None, path=None):
+    """Cases underpaid (attendance above paid days) in at least min_periods periods"""
+    return query(UNDERPAID_SQL + """
+        SELECT case_number AS "Case number", provider AS "Provider", branch AS "Branch",
+               COUNT(DISTINCT period) AS "Periods", GROUP_CONCAT(period, ', ') AS "Paid Periods",
+               SUM(unpaid_days) AS "Unpaid Days", ROUND(SUM(unpaid_amount), 2) AS "Unpaid Amount"
+        FROM repeat GROUP BY case_number, provider, branch ORDER BY "Unpaid Amount" DESC""",
+        {"min_periods": min_periods, "since": since or ""}, path)
+
+def underpayments_by_branch(min_periods=2, since=None, path=None):
+    """Repeat underpayments summed per branch"""
+    return query(UNDERPAID_SQL + """
+        SELECT branch AS "Branch", COUNT(DISTINCT case_number) AS "Cases", COUNT(*) AS "Case Periods",
+               SUM(unpaid_days) AS "Unpaid Days", ROUND(SUM(unpaid_amount), 2) AS "Unpaid Amount"
+        FROM repeat GROUP BY branch ORDER BY "Unpaid Amount" DESC""",
+        {"min_periods": min_periods, "since": since or ""}, path)
+
+def period_summary(path=None):
+    """Cases, paid days and pay per provider and period"""
+    return query("""
+        SELECT paid_period AS "Period", provider AS "Provider", cases AS "Cases",
+               days_attended AS "Paid Days Attended", ROUND(gross_pay, 2) AS "Gross Pay", ROUND(net_pay, 2) AS "Net Pay"
+        FROM provider_periods ORDER BY paid_period DESC, provider""", path=path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and query the historical payment warehouse.")
+    parser.add_argument("--warehouse", default=None, help=f"SQLite file (default {warehouse_path})")
+    parser.add_argument("--output-dir", help="Load the converted statements of this Parquet store")
+    parser.add_argument("--attendance", help="Load this attendance export")
+    parser.add_argument("--period", help="Period of the attendance export (YYYY-MM); read from its header by default")
+    parser.add_argument("--case", help="Show a case's payment and attendance history")
+    parser.add_argument("--underpaid-branches", action="store_true", help="Show repeat underpayments by branch")
+    parser.add_argument("--min-periods", type=int, default=2, help="Periods a case must be underpaid in")
+    parser.add_argument("--since", help="Only periods from this one on (YYYY-MM)")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the derived tables")
+    args = parser.parse_args()
+    if args.rebuild:
+        rebuild(args.warehouse)
+        print(":white_tick: Rebuilt the derived tables")
+    if args.output_dir:
+        provider_frames = {provider: payment_store.read_provider(provider, output_dir=args.output_dir)
+                           for provider in payment_store.list_providers(args.output_dir)}
+        added = add_payments(provider_frames, args.warehouse)
+        print(f":file_folder: Added {added} statement lines from '{args.output_dir}'")
+    if args.attendance:
+        import attendance_loader
+        from attendance_index import file_hash
+        with open(args.attendance, "rb") as f:
+            data = f.read()
+        period = args.period or attendance_loader.report_period(data)
+        if period is None:
+            parser.error("Could not read the attendance period from the export; pass --period YYYY-MM")
+        cases = add_attendance(attendance_loader.load_attendance(data), period, file_hash(data), args.warehouse)
+        print(f":file_folder: Stored attendance of {cases} cases for {period}")
+    started = time.perf_counter()
+    if args.case:
+        print(case_history(args.case, args.since, args.warehouse).to_string(index=False))
+    if args.underpaid_branches:
+        print(underpayments_by_branch(args.min_periods, args.since, args.warehouse).to_string(index=False))
+    if args.case or args.underpaid_branches:
+        print(f":stopwatch: Query took {time.perf_counter() - started:.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,143 +1,475 @@
-import pdfplumber
-import pandas as pd
+import argparse
 import re
 import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import datetime
+import text_backends
+from text_backends import iter_page_texts, count_pages
+import coordinate_extractor
+import extraction_cache
+import metrics
+import payment_store
+from payment_store import statement_columns
 # Input and output directories
 input_dir = "input"
 output_dir = "output"
-# Columns to extract
-columns = [
-    "Client", "Suffix", "Name", "Rate Type", "Quantity", "Rate", "Subtotal", "Care Level",
-    "Six Month Begin", "Days Attended", "Days Absent", "Total Days Absent", "C1 Days Absent",
-    "Holidays", "Approved Days", "C1 Days", "Gross Pay", "Weekly Fee", "Fee Due",
-    "Total Net Adjusted Pay", "Special Needs", "Previously Paid", "Difference Paid"
-]
-# Dictionary to hold data for each provider name
-provider_data = {}
+# Worker processes for extraction (1 = serial) and pages per worker task
+max_workers = int(os.environ.get("PDF_CONVERTER_WORKERS", "1"))
+pages_per_chunk = int(os.environ.get("PDF_CONVERTER_PAGES_PER_CHUNK", "25"))
+# Reuse parsed rows of unchanged PDFs (see extraction_cache.py)
+use_cache = os.environ.get("PDF_CONVERTER_CACHE", "1") != "0"
+# How rows are read off a page: "text" parses the backend's plain text,
+# "coordinates" skips pages without client lines and maps characters to
+# columns by position (see coordinate_extractor.py)
+EXTRACTORS = ("text", "coordinates")
+default_extractor = os.environ.get("PDF_CONVERTER_EXTRACTOR", "text")
+# Bump whenever parsing changes so stale cache entries are ignored
+PARSER_VERSION = 3
+# Raised from inside a conversion when its cancel event is set; nothing is
+# written to the store for a cancelled run
+class ConversionCancelled(Exception):
+    pass
+def check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise ConversionCancelled("Conversion cancelled")
+# Payment line grammar, compiled once: client, suffix, two-word name, rate
+# type, quantity, then rate and subtotal (either may be glued to the previous
+# value, as in "1.00$100.00$1,797.00"), care level and six month begin. The
+# remaining columns follow as whitespace-separated tokens.
+MONEY_PATTERN = r'\$\d+(?:,\d{3})*(?:\.\d{2})?'
+PAYMENT_LINE_RE = re.compile(
+    r'(\d{8})\s+(\d{2})\s+([A-Za-z]+\s+[A-Za-z]+)\s+([WD])\s+(\d+\.\d{2})\s*'
+    rf'({MONEY_PATTERN})\s*({MONEY_PATTERN})\s+([A-Z])\s+(\d{{1,2}}/\d{{2}})\s+(.+)'
+)
+CLIENT_LINE_RE = re.compile(r'\d{8}')
+# Parse a payment line in a single pass. Returns (row, rule) where rule is
+# "full" when the line had all 23 columns (extra tokens are dropped),
+# "padded" when 20-22 columns were found and the tail was filled with "",
+# or (None, None) when the line was rejected.
+def parse_line(line):
+    match = PAYMENT_LINE_RE.match(line)
+    if not match:
+        return None, None
+    row = list(match.groups())
+    row[9:] = row[9].split()
+    if len(row) >= len(statement_columns):
+        return row[:len(statement_columns)], "full"
+    if len(row) >= 20:
+        row.extend([""] * (len(statement_columns) - len(row)))
+        return row, "padded"
+    return None, None
+# "February 2025" -> "2025-02", or None if it is not a month and year
+def parse_period(text):
+    try:
+        return datetime.strptime(' '.join(text.split()), "%B %Y").strftime("%Y-%m")
+    except ValueError:
+        return None
 # Helper: parse payment lines
 def parse_payment_line(line):
-    line = re.sub(r'(\$\d+(?:,\d{3})*(?:\.\d{2})?)(\$\d+(?:,\d{3})*(?:\.\d{2})?)', r'\1 \2', line)
-    parts = line.split()
-    if len(parts) < 20:
-        return None
-    row_data = []
-    try:
-        client, suffix = parts[0], parts[1]
-        if not (re.match(r'^\d{8}$', client) and re.match(r'^\d{2}$', suffix)):
-            return None
-        row_data += [client, suffix]
-        name_parts = []
-        i = 2
-        while i < len(parts) and re.match(r'^[A-Za-z]+$', parts[i]):
-            name_parts.append(parts[i])
-            i += 1
-        if not name_parts:
-            return None
-        row_data.append(' '.join(name_parts))
-        if i >= len(parts) or not re.match(r'^[WD]$', parts[i]):
-            return None
-        row_data.append(parts[i]); i += 1
-        if i >= len(parts) or not re.match(r'^\d+\.\d{2}$', parts[i]):
-            return None
-        row_data.append(parts[i]); i += 1
-        for _ in range(17):
-            if i >= len(parts):
-                return None
-            row_data.append(parts[i]); i += 1
-        if len(row_data) == len(columns):
-            return row_data
+    return parse_line(line)[0]
+# Parse one page of text into payment rows and provider header lines. Each
+# row ends with the period of the "Paid Period <Month YYYY>" heading it is
+# listed under ("" if none precedes it on the page; statements repeat the
+# heading at the top of every page).
+# rule_counts, when given, is a dict whose "full", "padded" and "rejected"
+# counters are incremented for every client line on the page.
+def parse_page_text(text, rule_counts=None):
+    rows = []
+    provider_headers = []
+    period = ""
+    lines = text.split('\n')
+    for line in lines:
+        line = line.strip()
+        if line.startswith("Provider ") and "Provider number" not in line:
+            provider_headers.append(line.strip())
+        if line.startswith("Paid Period "):
+            period = parse_period(line[len("Paid Period "):]) or period
+        if CLIENT_LINE_RE.match(line):
+            parsed_row, rule = parse_line(line)
+            if parsed_row:
+                parsed_row.append(period)
+                rows.append(parsed_row)
+            if rule_counts is not None:
+                rule = rule or "rejected"
+                rule_counts[rule] = rule_counts.get(rule, 0) + 1
+    return rows, provider_headers
+# Same as parse_page_text for a page read by coordinate_extractor: headings
+# are matched on each line's text, client lines are split into columns by
+# the position of their runs instead of by parse_line's grammar
+def parse_page_lines(lines, rule_counts=None):
+    rows = []
+    provider_headers = []
+    period = ""
+    for runs in lines:
+        line = coordinate_extractor.line_text(runs)
+        if line.startswith("Provider ") and "Provider number" not in line:
+            provider_headers.append(line)
+        if line.startswith("Paid Period "):
+            period = parse_period(line[len("Paid Period "):]) or period
+        if CLIENT_LINE_RE.match(line):
+            parsed_row, rule = coordinate_extractor.parse_row(runs)
+            if parsed_row:
+                parsed_row.append(period)
+                rows.append(parsed_row)
+            if rule_counts is not None:
+                rule = rule or "rejected"
+                rule_counts[rule] = rule_counts.get(rule, 0) + 1
+    return rows, provider_headers
+# Parse one page, timed. Returns (rows, provider headers, page stats) where
+# the stats hold the page number, rows, full/padded/rejected line counts,
+# whether the coordinates probe skipped the page and the seconds spent
+# extracting and parsing it. A page is its text for the "text" extractor;
+# for "coordinates" it is its lines, or its probe text if it was skipped, in
+# which case only provider headers are read from it.
+def parse_page(page_number, page, extract_seconds=0.0, extractor="text"):
+    started = time.perf_counter()
+    rule_counts = {}
+    skipped = extractor == "coordinates" and isinstance(page, str)
+    if skipped:
+        provider_headers = parse_page_text(page)[1]
+        rows = []
+    elif extractor == "coordinates":
+        rows, provider_headers = parse_page_lines(page, rule_counts)
+    else:
+        rows, provider_headers = parse_page_text(page, rule_counts) if page else ([], [])
+    page_stats = {"page": page_number, "rows": len(rows), "skipped": int(skipped),
+                  "extract_seconds": extract_seconds, "parse_seconds": time.perf_counter() - started}
+    page_stats.update({rule: rule_counts.get(rule, 0) for rule in metrics.RULES})
+    return rows, provider_headers, page_stats
+# Pages of a range (see parse_page), each with the seconds the backend took
+# to produce it
+def timed_page_texts(pdf_path, start=0, stop=None, backend=None, extractor="text"):
+    if extractor == "coordinates":
+        texts = coordinate_extractor.iter_page_lines(pdf_path, start, stop, backend=backend)
+    else:
+        texts = iter_page_texts(pdf_path, start, stop, backend=backend)
+    while True:
+        started = time.perf_counter()
+        text = next(texts, None)
+        if text is None:
+            return
+        yield text, time.perf_counter() - started
+# Extract parsed rows and provider header lines from a range of pages.
+# on_page(page_stats) is called after every page, and cancel (a
+# threading.Event) is checked before each one.
+def extract_page_range(pdf_path, start=0, stop=None, backend=None, on_page=None, cancel=None, extractor="text"):
+    rows = []
+    provider_headers = []
+    for page_number, (text, extract_seconds) in enumerate(timed_page_texts(pdf_path, start, stop, backend, extractor),
+                                                          start=start + 1):
+        check_cancelled(cancel)
+        page_rows, page_headers, page_stats = parse_page(page_number, text, extract_seconds, extractor)
+        rows.extend(page_rows)
+        provider_headers.extend(page_headers)
+        if on_page is not None:
+            on_page(page_stats)
+    return rows, provider_headers
+# Worker task for the process pool: like extract_page_range, plus the stats
+# of every page, since callbacks cannot cross processes
+def extract_chunk(pdf_path, start, stop, backend=None, extractor="text"):
+    page_stats = []
+    rows, provider_headers = extract_page_range(pdf_path, start, stop, backend, on_page=page_stats.append,
+                                                extractor=extractor)
+    return rows, provider_headers, page_stats
+# Streaming extraction: yield (page number, rows, provider headers) one page
+# at a time. The backend releases each page's objects before it is yielded,
+# and the document is reopened every window_pages pages because the PDF
+# engines keep per-document caches that grow with every page read.
+def iter_page_rows(pdf_path, backend=None, window_pages=50, filename=None, extractor="text"):
+    filename = filename or os.path.basename(pdf_path)
+    page_count = count_pages(pdf_path, backend=backend)
+    for start in range(0, page_count, window_pages):
+        stop = min(start + window_pages, page_count)
+        texts = timed_page_texts(pdf_path, start, stop, backend=backend, extractor=extractor)
+        for page_number, (text, extract_seconds) in enumerate(texts, start=start + 1):
+            rows, provider_headers, page_stats = parse_page(page_number, text, extract_seconds, extractor)
+            metrics.record_page(filename, page_stats)
+            yield page_number, rows, provider_headers
+# Split a PDF into (start, stop) page ranges for the worker pool
+def page_ranges(pdf_path, chunk_size, backend=None):
+    page_count = count_pages(pdf_path, backend=backend)
+    return [(start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+# Merge the page-range results of one file (in page order) into provider_data.
+# The provider name carries over between ranges, so a range without its own
+# header still belongs to the most recent "Provider ..." line before it.
+# Returns the file's rows and raw provider line for the extraction cache.
+def merge_file_results(filename, chunk_results, provider_data):
+    print(f":page_facing_up: Processing {filename}")
+    provider_name = None
+    rows = []
+    for chunk_rows, provider_headers in chunk_results:
+        for header in provider_headers:
+            provider_name = header
+            print(f":label: Found Provider: {provider_name}")
+        rows.extend(chunk_rows)
+    file_rows, file_provider = rows, provider_name
+    if provider_name and rows:
+        provider_name = ' '.join(provider_name.split())
+        if provider_name not in provider_data:
+            provider_data[provider_name] = []
+        provider_data[provider_name].extend(rows)
+        print(f":white_tick: Added {len(rows)} rows for {provider_name}")
+    return file_rows, file_provider
+# Write an in-memory PDF to a file in spill_dir once, so the worker pool's
+# page-range tasks each pickle its path instead of the whole PDF
+def spill_pdf(source, spill_dir, file_index):
+    path = os.path.join(spill_dir, f"{file_index}.pdf")
+    with open(path, "wb") as f:
+        f.write(text_backends.pdf_input(source))
+    return path
+# Block on a pool future, checking the cancel event every half second
+def wait_result(future, cancel):
+    while not wait([future], timeout=0.5).done:
+        check_cancelled(cancel)
+    return future.result()
+# Process each PDF, one file at a time or fanned out over a process pool.
+# PDFs whose content is already in the extraction cache are never opened.
+# Returns {provider name: rows}; files that fail are recorded in errors and
+# the names of files served from the extraction cache in cached.
+# progress(event) receives a dict per page (per page range with workers > 1)
+# with file, file_index, files, page, pages, rows, fallback (rows parsed by
+# the padded rule) and cached; cancel is a threading.Event that aborts the
+# run with ConversionCancelled. sources, when given, maps each file name to
+# its PDF bytes, which are parsed in memory instead of reading input_dir
+# (with workers > 1 each one is written once to a temporary file shared by
+# its page-range tasks).
+# extractor is "text" or "coordinates" (see EXTRACTORS).
+def process_pdfs(pdf_files, input_dir=input_dir, workers=1, chunk_size=25, backend=None, cache=True, errors=None,
+                 progress=None, cancel=None, sources=None, extractor=None, cached=None):
+    backend = backend or text_backends.default_backend
+    extractor = extractor or default_extractor
+    if extractor not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor '{extractor}'. Choose from: {', '.join(EXTRACTORS)}")
+    # Both extractors' rows are cached, under separate keys
+    cache_backend = backend if extractor == "text" else f"{backend}-{extractor}"
+    errors = errors if errors is not None else []
+    cached_files = cached if cached is not None else []
+    provider_data = {}
+    pending = []
+    def report(file_index, filename, page, pages, rows, fallback=0, cached=False):
+        if progress is not None:
+            progress({"file": filename, "file_index": file_index, "files": len(pdf_files), "page": page,
+                      "pages": pages, "rows": rows, "fallback": fallback, "cached": cached})
+    def on_page(file_index, filename, pages, page_stats):
+        metrics.record_page(filename, page_stats)
+        report(file_index, filename, page_stats["page"], pages, page_stats["rows"], page_stats["padded"])
+    for file_index, filename in enumerate(pdf_files, start=1):
+        pdf_path = sources[filename] if sources is not None else os.path.join(input_dir, filename)
+        with metrics.stage("cache_lookup"):
+            key = extraction_cache.cache_key(pdf_path, PARSER_VERSION, cache_backend) if cache else None
+            entry = extraction_cache.load_cached(key) if cache else None
+        if entry:
+            rows, provider_name = entry
+            with metrics.stage("merge"):
+                merge_file_results(filename, [(rows, [provider_name] if provider_name else [])], provider_data)
+            metrics.count("cached_files")
+            cached_files.append(filename)
+            report(file_index, filename, None, None, len(rows), cached=True)
         else:
-            return None
-    except:
-        return None
-def fallback_parse(line):
-    pattern = r'''
-        (\d{8})\s+(\d{2})\s+([A-Za-z]+\s+[A-Za-z]+)\s+([WD])\s+(\d+\.\d{2})\s*
-        (\$\d+(?:,\d{3})*(?:\.\d{2})?)\s*(\$\d+(?:,\d{3})*(?:\.\d{2})?)\s+([A-Z])\s+
-        (\d{1,2}/\d{2})\s+(.+)
-    '''
-    match = re.match(pattern, line, re.VERBOSE)
-    if match:
-        groups = list(match.groups())
-        remaining = groups[9].split()
-        result = groups[:9] + remaining
-        if len(result) >= len(columns):
-            return result[:len(columns)]
-        elif len(result) >= 20:
-            while len(result) < len(columns):
-                result.append("")
-            return result
-    return None
-# Process each PDF
-for filename in os.listdir(input_dir):
-    if filename.lower().endswith(".pdf"):
-        pdf_path = os.path.join(input_dir, filename)
-        print(f":page_facing_up: Processing {filename}")
-        with pdfplumber.open(pdf_path) as pdf:
-            provider_name = None
-            rows = []
-            for page in pdf.pages:
-                text = page.extract_text()
-                if not text:
+            pending.append((file_index, filename, pdf_path, key))
+    if workers <= 1:
+        for file_index, filename, pdf_path, key in pending:
+            try:
+                pages = count_pages(pdf_path, backend=backend) if progress is not None else None
+                chunk_results = [extract_page_range(
+                    pdf_path, backend=backend, cancel=cancel, extractor=extractor,
+                    on_page=lambda page_stats, args=(file_index, filename, pages): on_page(*args, page_stats))]
+            except ConversionCancelled:
+                raise
+            except Exception as e:
+                print(f":x: Could not read {filename}: {e}")
+                errors.append((filename, str(e)))
+                continue
+            with metrics.stage("merge"):
+                file_rows, file_provider = merge_file_results(filename, chunk_results, provider_data)
+            if cache:
+                extraction_cache.store_cached(key, file_rows, file_provider)
+    else:
+        with tempfile.TemporaryDirectory(prefix="pdf_converter_") as spill_dir, \
+                ProcessPoolExecutor(max_workers=workers) as pool:
+            file_futures = []
+            for file_index, filename, pdf_path, key in pending:
+                try:
+                    if not text_backends.is_path(pdf_path):
+                        pdf_path = spill_pdf(pdf_path, spill_dir, file_index)
+                    ranges = page_ranges(pdf_path, chunk_size, backend)
+                    futures = [pool.submit(extract_chunk, pdf_path, start, stop, backend, extractor) for start, stop in ranges]
+                except Exception as e:
+                    print(f":x: Could not read {filename}: {e}")
+                    errors.append((filename, str(e)))
                     continue
-                lines = text.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if line.startswith("Provider ") and "Provider number" not in line:
-                        provider_name = line.strip()
-                        print(f":label: Found Provider: {provider_name}")
-                    if re.match(r'^\d{8}', line):
-                        parsed_row = parse_payment_line(line)
-                        if parsed_row:
-                            rows.append(parsed_row)
-                        else:
-                            fallback_row = fallback_parse(line)
-                            if fallback_row:
-                                rows.append(fallback_row)
-            if provider_name and rows:
-                provider_name = ' '.join(provider_name.split())
-                if provider_name not in provider_data:
-                    provider_data[provider_name] = []
-                provider_data[provider_name].extend(rows)
-                print(f":white_tick: Added {len(rows)} rows for {provider_name}")
-# Save merged data to separate Excel file per provider
-os.makedirs(output_dir, exist_ok=True)
-# Define formatting functions
-def format_currency(val):
-    try:
-        return "${:,.2f}".format(float(val.replace('$', '').replace(',', '')))
-    except:
-        return val
-def format_number(val):
+                file_futures.append((file_index, filename, key, ranges, futures))
+            # Collect in submission order so the merged output matches the serial path
+            for file_index, filename, key, ranges, futures in file_futures:
+                try:
+                    chunk_results = []
+                    for (start, stop), future in zip(ranges, futures):
+                        chunk_rows, provider_headers, page_stats = wait_result(future, cancel)
+                        chunk_results.append((chunk_rows, provider_headers))
+                        for stats in page_stats:
+                            metrics.record_page(filename, stats)
+                        report(file_index, filename, stop, ranges[-1][1], len(chunk_rows),
+                               sum(stats["padded"] for stats in page_stats))
+                except ConversionCancelled:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise
+                except Exception as e:
+                    print(f":x: Could not read {filename}: {e}")
+                    errors.append((filename, str(e)))
+                    continue
+                with metrics.stage("merge"):
+                    file_rows, file_provider = merge_file_results(filename, chunk_results, provider_data)
+                if cache:
+                    extraction_cache.store_cached(key, file_rows, file_provider)
+    if cache:
+        extraction_cache.evict_cache()
+        extraction_cache.report_cache_stats()
+    return provider_data
+# List the PDFs to convert as (file names, sources): the .pdf files of
+# input_dir, or the given {file name: PDF as bytes/memoryview/BytesIO},
+# normalized once to bytes (an upload's getvalue() shares its buffer)
+def pdf_sources(input_dir, sources=None):
+    if sources is None:
+        return [filename for filename in sorted(os.listdir(input_dir)) if filename.lower().endswith(".pdf")], None
+    sources = {filename: text_backends.pdf_input(source) for filename, source in sources.items()}
+    return sorted(sources), sources
+# Convert every PDF in input_dir (or the in-memory sources) and save each
+# provider to the Parquet store.
+# Returns ({stored provider name: DataFrame of all its stored rows}, stats).
+# progress and cancel are passed through to process_pdfs.
+def convert_pdfs(input_dir=input_dir, output_dir=output_dir, workers=max_workers, chunk_size=pages_per_chunk,
+                 backend=None, cache=use_cache, progress=None, cancel=None, sources=None, extractor=None):
+    started = time.perf_counter()
+    errors = []
+    cached_files = []
+    pdf_files, sources = pdf_sources(input_dir, sources)
+    with metrics.stage("process_pdfs"):
+        provider_data = process_pdfs(pdf_files, input_dir=input_dir, workers=workers, chunk_size=chunk_size,
+                                     backend=backend, cache=cache, errors=errors, progress=progress, cancel=cancel,
+                                     sources=sources, extractor=extractor, cached=cached_files)
+    # Save merged data to the provider's partition of the Parquet store
+    provider_frames = {}
+    new_rows = 0
+    if provider_data:
+        for provider, data in provider_data.items():
+            with metrics.stage("store_write"):
+                df, added = payment_store.write_provider(provider, payment_store.typed_frame(data), output_dir=output_dir)
+            provider_frames[payment_store.safe_name(provider)] = df
+            new_rows += added
+            print(f":file_folder: Saved {added} new rows for '{provider}' to "
+                  f"'{payment_store.partition_path(provider, output_dir=output_dir)}'")
+    else:
+        print(":warning: No data found in any PDF.")
+    stats = {
+        "files": len(pdf_files),
+        "cached_files": len(cached_files),
+        "providers": len(provider_data),
+        "rows": sum(len(data) for data in provider_data.values()),
+        "new_rows": new_rows,
+        "errors": errors,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    record_stats(stats)
+    return provider_frames, stats
+# Bounded-memory conversion: rows are handed to a ChunkedProviderWriter page
+# by page and written in chunks, so peak memory does not depend on document
+# length. Rows go to the most recent "Provider ..." line (rows seen before the
+# first one wait for it). Bypasses the extraction cache. Returns stats only.
+def convert_pdfs_streaming(input_dir=input_dir, output_dir=output_dir, backend=None, chunk_rows=2000, sources=None,
+                           extractor=None):
+    started = time.perf_counter()
+    errors = []
+    rows_parsed = 0
+    providers = set()
+    pdf_files, sources = pdf_sources(input_dir, sources)
+    writer = payment_store.ChunkedProviderWriter(output_dir, chunk_rows=chunk_rows)
     try:
-        return "{:.2f}".format(float(val))
-    except:
-        return val
-if provider_data:
-    for provider, data in provider_data.items():
-        df = pd.DataFrame(data, columns=columns)
-        # Apply formatting to relevant columns
-        currency_cols = ["Rate", "Subtotal", "Gross Pay", "Fee Due", "Total Net Adjusted Pay", "Previously Paid", "Difference Paid"]
-        numeric_cols = ["Quantity", "Weekly Fee"]
-        for col in currency_cols:
-            if col in df.columns:
-                df[col] = df[col].apply(format_currency)
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = df[col].apply(format_number)
-        # Ensure uniqueness by dropping duplicate rows
-        df.drop_duplicates(inplace=True)
-        # Save or append
-        safe_provider_name = re.sub(r'[\\/*?:"<>|]', "_", provider)
-        excel_path = os.path.join(output_dir, f"{safe_provider_name}.xlsx")
-        if os.path.exists(excel_path):
-            existing_df = pd.read_excel(excel_path, dtype=str).fillna("")
-            combined_df = pd.concat([existing_df, df], ignore_index=True)
-            combined_df.drop_duplicates(inplace=True)
-            combined_df.to_excel(excel_path, index=False)
-            print(f":file_folder: Appended {len(df)} rows to existing file for '{provider}'")
+        for filename in pdf_files:
+            print(f":page_facing_up: Processing {filename}")
+            provider_name = None
+            pending_rows = []
+            file_rows = 0
+            try:
+                for page_number, rows, provider_headers in iter_page_rows(
+                        sources[filename] if sources is not None else os.path.join(input_dir, filename), backend,
+                        filename=filename, extractor=extractor or default_extractor):
+                    for header in provider_headers:
+                        provider_name = ' '.join(header.split())
+                        print(f":label: Found Provider: {provider_name}")
+                    if provider_name is None:
+                        pending_rows.extend(rows)
+                        continue
+                    rows = pending_rows + rows if pending_rows else rows
+                    pending_rows = []
+                    with metrics.stage("store_write"):
+                        writer.add(provider_name, rows)
+                    providers.add(provider_name)
+                    file_rows += len(rows)
+            except Exception as e:
+                print(f":x: Could not read {filename}: {e}")
+                errors.append((filename, str(e)))
+                continue
+            rows_parsed += file_rows
+            if file_rows:
+                print(f":white_tick: Added {file_rows} rows for {provider_name}")
+    finally:
+        with metrics.stage("store_write"):
+            new_rows = writer.close()
+    for provider, added in new_rows.items():
+        print(f":file_folder: Saved {added} new rows for '{provider}' to "
+              f"'{payment_store.partition_dir(provider, output_dir=output_dir)}'")
+    if not providers:
+        print(":warning: No data found in any PDF.")
+    stats = {
+        "files": len(pdf_files),
+        "cached_files": 0,
+        "providers": len(providers),
+        "rows": rows_parsed,
+        "new_rows": sum(new_rows.values()),
+        "errors": errors,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    record_stats(stats)
+    return stats
+# Report a conversion's stats to the active metrics run
+def record_stats(stats):
+    for key in ("files", "providers", "rows", "new_rows"):
+        metrics.count(key, stats[key])
+    metrics.count("errors", len(stats["errors"]))
+    metrics.count("conversion_seconds", stats["seconds"])
+def main():
+    parser = argparse.ArgumentParser(description="Convert payment statement PDFs into the Parquet store.")
+    parser.add_argument("--input-dir", default=input_dir, help="Directory of statement PDFs")
+    parser.add_argument("--output-dir", default=output_dir, help="Parquet store directory")
+    parser.add_argument("--workers", type=int, default=max_workers, help="Worker processes (1 = serial)")
+    parser.add_argument("--pages-per-chunk", type=int, default=pages_per_chunk, help="Pages per worker task")
+    parser.add_argument("--backend", default=None, choices=list(text_backends.BACKENDS), help="Text extraction backend")
+    parser.add_argument("--extractor", default=None, choices=list(EXTRACTORS),
+                        help="Row extraction: page text, or probe-and-coordinates")
+    parser.add_argument("--no-cache", action="store_true", help="Re-parse every PDF, ignoring the extraction cache")
+    parser.add_argument("--stream", action="store_true", help="Bounded-memory mode: write rows in chunks page by page")
+    parser.add_argument("--chunk-rows", type=int, default=2000, help="Rows per written chunk in --stream mode")
+    parser.add_argument("--metrics-json", default=None, help="Write run metrics to this JSON file")
+    parser.add_argument("--metrics-prom", default=None, help="Write run metrics to this Prometheus textfile")
+    args = parser.parse_args()
+    with metrics.recording(metrics.RunMetrics("convert")) as run:
+        if args.stream:
+            stats = convert_pdfs_streaming(args.input_dir, args.output_dir, backend=args.backend,
+                                           chunk_rows=args.chunk_rows, extractor=args.extractor)
         else:
-            df.to_excel(excel_path, index=False)
-            print(f":file_folder: Saved {len(df)} rows for '{provider}' to '{excel_path}'")
-else:
-    print(":warning: No data found in any PDF.")
\ No newline at end of file
+            _, stats = convert_pdfs(args.input_dir, args.output_dir, workers=args.workers,
+                                    chunk_size=args.pages_per_chunk, backend=args.backend,
+                                    cache=use_cache and not args.no_cache, extractor=args.extractor)
+    print(f":stopwatch: Converted {stats['files']} file(s), {stats['rows']} rows in {stats['seconds']}s")
+    for stage, entry in run.stages.items():
+        print(f":stopwatch: {stage}: {entry['seconds']:.3f}s")
+    if args.metrics_json:
+        run.write_json(args.metrics_json)
+    if args.metrics_prom:
+        run.write_prometheus(args.metrics_prom)
+    if stats["errors"]:
+        raise SystemExit(1)
+if __name__ == "__main__":
+    main()
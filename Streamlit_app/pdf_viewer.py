@@ -0,0 +1,81 @@
+import io
+import threading
+from collections import OrderedDict
+from text_backends import pdf_input, pdfium_lock, pypdfium2_page_count
+# Page-at-a-time PDF rendering for the "View Uploaded PDFs" expander.
+# Only the requested pages are rendered (with pypdfium2) and the PNGs are
+# kept in a bounded LRU cache keyed by (file hash, page, zoom), so paging
+# back and forth through a statement does not re-render or re-send the
+# whole document. PDFium is not thread-safe and every session renders from
+# its own script thread, so rendering holds text_backends.pdfium_lock.
+max_cache_bytes = 64 * 1024 * 1024
+
+class PageImageCache:
+    """Thread-safe LRU of rendered page PNGs, bounded by total bytes"""
+
+    def __init__(self, max_bytes=max_cache_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            image = self.entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= len(self.entries.pop(key))
+            self.entries[key] = image
+            self.total_bytes += len(image)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+# Shared by every session of the app process
+page_cache = PageImageCache()
+
+def page_count(pdf_path):
+    return pypdfium2_page_count(pdf_path)
+
+def render_pages(pdf_path, file_hash, start, stop, zoom=1.0):
+    """PNG bytes of pages [start, stop) at the given zoom, rendering only cache misses"""
+    images = {}
+    missing = []
+    for page_index in range(start, stop):
+        image = page_cache.get((file_hash, page_index, zoom))
+        if image is None:
+            missing.append(page_index)
+        else:
+            images[page_index] = image
+    if missing:
+        import pypdfium2 as pdfium
+        with pdfium_lock:
+            doc = pdfium.PdfDocument(pdf_input(pdf_path))
+        try:
+            for page_index in missing:
+                with pdfium_lock:
+                    page = doc[page_index]
+                    bitmap = page.render(scale=zoom)
+                    # to_pil() shares the bitmap's buffer; copy before closing it
+                    image = bitmap.to_pil().copy()
+                    bitmap.close()
+                    page.close()
+                # PNG encoding does not touch PDFium; do it outside the lock
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG")
+                images[page_index] = buffer.getvalue()
+                page_cache.put((file_hash, page_index, zoom), images[page_index])
+        finally:
+            with pdfium_lock:
+                doc.close()
+    return [images[page_index] for page_index in range(start, stop)]
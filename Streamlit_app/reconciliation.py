@@ -0,0 +1,283 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import pandas as pd
+import metrics
+import payment_store
+from attendance_index import AttendanceIndex
+# Batched reconciliation of every provider against the attendance export.
+# All providers' extracted rows are concatenated with a "Provider" key and
+# each of the five Compare Data analyses runs as one vectorized pass over
+# that frame; results are only split per provider at output time.
+#   python reconciliation.py --attendance temp_attendance.xlsx
+#   python reconciliation.py --attendance march.xlsx --statements pdfs/march --workers 4
+#   python reconciliation.py --attendance march.xlsx --format parquet --consolidated results_march.xlsx
+RESULTS_DIR = "Analyzed Results"
+# (result key, subfolder of RESULTS_DIR, file name pattern) per analysis
+ANALYSES = [
+    ("attendance_comparison", "Attendance_comparison", "attendance_comparison_result_{}.xlsx"),
+    ("branch_names", "Branch_Names", "Branch_Names_{}.xlsx"),
+    ("filtered_cases", "Filter_Cases_with_Branch_names", "filtered_case_numbers_by_branch_{}.xlsx"),
+    ("missing_cases", "Missing_cases", "missing_case_numbers_{}.xlsx"),
+    ("overpaid_cases", "Less_Paid", "attendance_overpaid_cases_filtered_{}.xlsx"),
+]
+
+def combine_providers(provider_frames):
+    """Concatenate {provider: extracted rows} into one frame with a Provider key"""
+    frames = [df.assign(Provider=provider) for provider, df in provider_frames.items()]
+    if not frames:
+        return pd.DataFrame(columns=payment_store.stored_columns + ['Provider'])
+    return pd.concat(frames, ignore_index=True)
+
+def attendance_mismatches(index, extracted):
+    """1. Cases whose attendance total differs from the statement's Days Attended"""
+    attendance_grouped = index.case_sums.rename(columns={'Attendance': 'Attendance_data'})
+    extracted_comparison = extracted[['Provider', 'Case number', 'Days Attended']].rename(
+        columns={'Days Attended': 'Extracted_data'})
+    # A flagged count (e.g. "19*") is not a plain statement figure: report it
+    # as not comparable rather than compare its number
+    extracted_comparison['Extracted_data'] = extracted_comparison['Extracted_data'].mask(
+        payment_store.flagged(extracted, 'Days Attended'))
+    merged_df = pd.merge(attendance_grouped, extracted_comparison, on='Case number', how='inner')
+    merged_df['Attendance_data'] = pd.to_numeric(merged_df['Attendance_data'], errors='coerce').astype(float)
+    merged_df['Extracted_data'] = pd.to_numeric(merged_df['Extracted_data'], errors='coerce').astype(float)
+    merged_df['Difference'] = merged_df['Attendance_data'] - merged_df['Extracted_data']
+    return merged_df[merged_df['Difference'] != 0]
+
+def provider_branches(index, extracted):
+    """2. Unique branches of each provider's cases"""
+    cases = extracted[['Provider', 'Case number']].drop_duplicates()
+    branches = pd.merge(cases, index.case_branch_pairs, on='Case number', how='inner')
+    return branches[['Provider', 'Branch']].drop_duplicates().sort_values(['Provider', 'Branch'])
+
+def branch_cases(index, branches):
+    """3. First attendance row of every case in each provider's branches"""
+    rows = index.case_branch_pairs.reset_index().rename(columns={'index': 'row'})
+    matched = pd.merge(branches, rows, on='Branch', how='inner')
+    matched = matched.sort_values(['Provider', 'row']).drop_duplicates(subset=['Provider', 'Case number'])
+    return matched[['Provider', 'Case number', 'Branch']]
+
+def missing_cases(filtered, extracted):
+    """4. Cases in a provider's branches that are missing from its statements"""
+    extracted_cases = extracted[['Provider', 'Case number']].copy()
+    extracted_cases['Case number'] = extracted_cases['Case number'].astype(str).str.strip()
+    merged = pd.merge(filtered[['Provider', 'Case number']], extracted_cases.drop_duplicates(),
+                      on=['Provider', 'Case number'], how='left', indicator=True)
+    missing = merged[merged['_merge'] == 'left_only'].drop_duplicates()
+    missing = missing.rename(columns={'Case number': 'Missing Case number'})
+    return missing[['Provider', 'Missing Case number']].sort_values(['Provider', 'Missing Case number'])
+
+def overpaid_cases(index, extracted):
+    """5. Cases where attendance x rate exceeds the gross pay on the statement"""
+    extracted_payment = extracted[['Provider', 'Case number', 'Rate', 'Gross Pay']].copy()
+    extracted_payment['Rate'] = extracted_payment['Rate'].replace(r'[\$,]', '', regex=True).astype(float)
+    extracted_payment['Gross Pay'] = extracted_payment['Gross Pay'].replace(r'[\$,]', '', regex=True).astype(float)
+    payment_merged = pd.merge(index.case_sums[['Case number', 'Attendance']], extracted_payment,
+                              on='Case number', how='inner')
+    payment_merged['Attendance'] = payment_merged['Attendance'].astype(float)
+    payment_merged['Calculated Pay'] = payment_merged['Attendance'] * payment_merged['Rate']
+    overpaid_df = payment_merged[payment_merged['Calculated Pay'] > payment_merged['Gross Pay']].copy()
+    overpaid_df['Amount Difference'] = (overpaid_df['Calculated Pay'] - overpaid_df['Gross Pay']).round(2)
+    return overpaid_df[['Provider', 'Case number', 'Amount Difference']]
+
+def split_by_provider(df, providers, columns):
+    """{provider: rows of df for that provider, without the Provider column}"""
+    groups = {provider: group[columns].reset_index(drop=True) for provider, group in df.groupby('Provider', sort=False)}
+    return {provider: groups.get(provider, pd.DataFrame(columns=columns)) for provider in providers}
+
+def case_numbers(df):
+    """Statement rows' case numbers, in the attendance export's Client/Suffix form"""
+    return df['Client'].astype(str) + '/' + df['Suffix']
+
+def reconcile(index, provider_frames, keys=None):
+    """Run the five analyses (or only the analysis keys given) for every
+    provider in one pass.
+
+    Returns (results, errors): results maps provider -> analysis key ->
+    DataFrame (None where the analysis did not apply or was not run), errors
+    maps an analysis key -> message for analyses that failed.
+    """
+    keys = set(keys) if keys is not None else {key for key, _, _ in ANALYSES}
+    providers = list(provider_frames)
+    with metrics.stage('combine_providers'):
+        extracted = combine_providers(provider_frames)
+        extracted['Case number'] = case_numbers(extracted)
+    metrics.count('reconciled_rows', len(extracted))
+    results = {provider: dict.fromkeys(key for key, _, _ in ANALYSES) for provider in providers}
+    errors = {}
+
+    def store(key, df, columns):
+        for provider, provider_df in split_by_provider(df, providers, columns).items():
+            results[provider][key] = provider_df
+
+    if 'attendance_comparison' in keys:
+        try:
+            with metrics.stage('attendance_comparison'):
+                store('attendance_comparison', attendance_mismatches(index, extracted),
+                      ['Case number', 'Attendance_data', 'Extracted_data', 'Difference'])
+        except Exception as e:
+            errors['attendance_comparison'] = str(e)
+    branches = None
+    if keys & {'branch_names', 'filtered_cases', 'missing_cases'}:
+        try:
+            with metrics.stage('branch_names'):
+                branches = provider_branches(index, extracted)
+                store('branch_names', branches, ['Branch'])
+        except Exception as e:
+            errors['branch_names'] = str(e)
+    if branches is not None and keys & {'filtered_cases', 'missing_cases'}:
+        # Filtered and missing cases only apply to providers with branches
+        with_branches = set(branches['Provider'])
+        try:
+            with metrics.stage('filtered_cases'):
+                filtered = branch_cases(index, branches)
+            with metrics.stage('missing_cases'):
+                missing = missing_cases(filtered, extracted)
+            for provider, provider_df in split_by_provider(filtered, providers, ['Case number', 'Branch']).items():
+                if provider in with_branches:
+                    results[provider]['filtered_cases'] = provider_df
+            for provider, provider_df in split_by_provider(missing, providers, ['Missing Case number']).items():
+                if provider in with_branches:
+                    results[provider]['missing_cases'] = provider_df
+        except Exception as e:
+            errors['filtered_cases'] = str(e)
+    if 'overpaid_cases' in keys:
+        try:
+            with metrics.stage('overpaid_cases'):
+                store('overpaid_cases', overpaid_cases(index, extracted), ['Case number', 'Amount Difference'])
+        except Exception as e:
+            errors['overpaid_cases'] = str(e)
+    return results, errors
+
+def result_path(results_dir, key, provider):
+    for analysis_key, subfolder, pattern in ANALYSES:
+        if analysis_key == key:
+            return os.path.join(results_dir, subfolder, pattern.format(provider))
+    raise KeyError(key)
+
+def write_results(results, results_dir=RESULTS_DIR):
+    """Write every provider's results to the Analyzed Results subfolders"""
+    for provider, provider_results in results.items():
+        for key, df in provider_results.items():
+            if df is None:
+                continue
+            path = result_path(results_dir, key, provider)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with metrics.stage('write_excel'):
+                df.to_excel(path, index=False)
+            metrics.count('result_rows', len(df))
+
+@contextmanager
+def timed(timings, stage):
+    """Add the wall time of the with-block to timings[stage]"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+def reconcile_shard(index, provider_frames, results_dir, fmt="excel"):
+    """Reconcile and write one group of providers; runs in a worker process"""
+    import result_sink
+    timings = {}
+    with timed(timings, "reconcile"):
+        results, errors = reconcile(index, provider_frames)
+    with timed(timings, "write"):
+        result_sink.write(results, results_dir, fmt)
+    return results, errors, timings
+
+def shard_providers(provider_frames, shards):
+    """Split providers into at most `shards` groups of roughly equal row counts"""
+    groups = [{} for _ in range(max(1, min(shards, len(provider_frames))))]
+    sizes = [0] * len(groups)
+    for provider, df in sorted(provider_frames.items(), key=lambda item: -len(item[1])):
+        smallest = sizes.index(min(sizes))
+        groups[smallest][provider] = df
+        sizes[smallest] += len(df)
+    return [group for group in groups if group]
+
+def run_batch(attendance, output_dir=payment_store.OUTPUT_DIR, results_dir=RESULTS_DIR, workers=1,
+              statements_dir=None, providers=None, fmt="excel"):
+    """Headless Compare Data run: optionally convert statement PDFs, then run
+    the five analyses and write the results to results_dir in `fmt` (see
+    result_sink.write; "excel" is the Analyzed Results workbook layout).
+
+    Providers are split across `workers` processes (each reconciles and writes
+    its own providers). Returns (results, errors, timings) where timings maps
+    stage -> seconds; worker stages report the slowest worker.
+    """
+    timings = {}
+    if statements_dir is not None:
+        import pdf_converter
+        with timed(timings, "convert"):
+            _, stats = pdf_converter.convert_pdfs(statements_dir, output_dir)
+        for filename, message in stats["errors"]:
+            print(f":x: Could not read {filename}: {message}")
+    with timed(timings, "load_attendance"):
+        index = AttendanceIndex.from_excel(attendance)
+    with timed(timings, "load_statements"):
+        providers = providers or payment_store.list_providers(output_dir)
+        provider_frames = {provider: payment_store.read_provider(provider, output_dir=output_dir) for provider in providers}
+    shards = shard_providers(provider_frames, workers)
+    results, errors = {}, {}
+    with timed(timings, "analyses"):
+        if len(shards) <= 1:
+            shard_results = [reconcile_shard(index, provider_frames, results_dir, fmt)]
+        else:
+            with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+                futures = [pool.submit(reconcile_shard, index, shard, results_dir, fmt) for shard in shards]
+                shard_results = [future.result() for future in futures]
+    for shard_result, shard_errors, shard_timings in shard_results:
+        results.update(shard_result)
+        errors.update(shard_errors)
+        for stage, seconds in shard_timings.items():
+            timings[stage] = max(timings.get(stage, 0.0), seconds)
+    results = {provider: results[provider] for provider in provider_frames}
+    return results, errors, timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile converted statements against an attendance export.")
+    parser.add_argument("--attendance", required=True, help="Attendance Excel file")
+    parser.add_argument("--statements", default=None, help="Directory of statement PDFs to convert first")
+    parser.add_argument("--output-dir", default=payment_store.OUTPUT_DIR, help="Parquet store of converted statements")
+    parser.add_argument("--results-dir", default=RESULTS_DIR, help="Where to write the analysis workbooks")
+    parser.add_argument("--providers", nargs="+", default=None, help="Only reconcile these providers (default: all)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes to spread providers over")
+    parser.add_argument("--format", default="excel", choices=["excel", "parquet", "workbook"],
+                        help="excel: one file per analysis (default); parquet: same layout as Parquet; "
+                             "workbook: one multi-sheet workbook per provider")
+    parser.add_argument("--consolidated", default=None, help="Also write every provider's results to this workbook")
+    parser.add_argument("--metrics-json", default=None, help="Write run metrics to this JSON file")
+    parser.add_argument("--metrics-prom", default=None, help="Write run metrics to this Prometheus textfile")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    with metrics.recording(metrics.RunMetrics("compare")) as run:
+        results, errors, timings = run_batch(args.attendance, args.output_dir, args.results_dir, workers=args.workers,
+                                             statements_dir=args.statements, providers=args.providers,
+                                             fmt=args.format)
+        if args.consolidated:
+            import result_sink
+            with timed(timings, "consolidated"):
+                result_sink.ResultSink(results).consolidated_workbook(args.consolidated)
+    # Worker processes do not report to this run; add the batch stage timings
+    for stage, seconds in timings.items():
+        run.add_stage(stage, seconds)
+    for provider, provider_results in results.items():
+        counts = ", ".join(f"{key}={len(df)}" for key, df in provider_results.items() if df is not None)
+        print(f":white_tick: {provider}: {counts}")
+    for key, message in errors.items():
+        print(f":x: {key} failed: {message}")
+    for stage, seconds in timings.items():
+        print(f":stopwatch: {stage}: {seconds:.3f}s")
+    print(f":stopwatch: total: {time.perf_counter() - started:.3f}s")
+    if args.metrics_json:
+        run.write_json(args.metrics_json)
+    if args.metrics_prom:
+        run.write_prometheus(args.metrics_prom)
+    if errors:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import io
+import os
+import pandas as pd
+import metrics
+import reconciliation
+# Where Compare Data results live once the analyses have run.
+# A ResultSink holds {provider: {analysis key: DataFrame}} in memory and can
+# mirror it to Parquet under Analyzed Results (same subfolders as the Excel
+# artifacts, one small file per provider and analysis). Excel is only built
+# when someone asks for it, with openpyxl's write-only (streaming) workbook:
+# one multi-sheet workbook per provider, or one consolidated workbook with a
+# Provider column on every sheet.
+FORMATS = ("excel", "parquet", "workbook")
+
+class ResultSink:
+    """In-memory analysis results with Parquet persistence and on-demand Excel"""
+
+    def __init__(self, results=None, results_dir=reconciliation.RESULTS_DIR):
+        self.results = dict(results or {})
+        self.results_dir = results_dir
+
+    def providers(self):
+        return list(self.results)
+
+    def get(self, provider, key):
+        return self.results.get(provider, {}).get(key)
+
+    def save_parquet(self):
+        """Write every non-empty result to <results_dir>/<subfolder>/<name>.parquet"""
+        with metrics.stage('write_parquet'):
+            for provider, provider_results in self.results.items():
+                for key, df in provider_results.items():
+                    if df is None:
+                        continue
+                    path = parquet_path(self.results_dir, key, provider)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    df.to_parquet(path, index=False)
+
+    def provider_workbook(self, provider, dest=None):
+        """One workbook for a provider, a sheet per analysis; bytes, or written to dest"""
+        sheets = [(subfolder, self.get(provider, key)) for key, subfolder, _ in reconciliation.ANALYSES]
+        return write_workbook([(title, df) for title, df in sheets if df is not None], dest)
+
+    def consolidated_workbook(self, dest=None):
+        """One workbook for all providers, a sheet per analysis with a Provider column"""
+        sheets = []
+        for key, subfolder, _ in reconciliation.ANALYSES:
+            frames = [df.assign(Provider=provider)[['Provider'] + list(df.columns)]
+                      for provider, provider_results in self.results.items()
+                      if (df := provider_results.get(key)) is not None]
+            if frames:
+                sheets.append((subfolder, pd.concat(frames, ignore_index=True)))
+        return write_workbook(sheets, dest)
+
+def parquet_path(results_dir, key, provider):
+    return os.path.splitext(reconciliation.result_path(results_dir, key, provider))[0] + ".parquet"
+
+def write_workbook(sheets, dest=None):
+    """Stream [(title, DataFrame)] into a write-only workbook.
+
+    Returns the workbook bytes, or writes it to the dest path and returns that.
+    """
+    from openpyxl import Workbook
+    with metrics.stage('write_excel'):
+        workbook = Workbook(write_only=True)
+        for title, df in sheets:
+            sheet = workbook.create_sheet(title[:31])
+            sheet.append([str(col) for col in df.columns])
+            for row in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+                sheet.append(list(row))
+        if not sheets:
+            workbook.create_sheet("Empty")
+        if dest is not None:
+            workbook.save(dest)
+            return dest
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return buffer.getvalue()
+
+def write(results, results_dir=reconciliation.RESULTS_DIR, fmt="excel"):
+    """Persist results: "excel" (one file per provider and analysis, the
+    Analyzed Results layout), "parquet" (same layout, Parquet files) or
+    "workbook" (one multi-sheet workbook per provider in results_dir)"""
+    if fmt == "excel":
+        reconciliation.write_results(results, results_dir)
+    elif fmt == "parquet":
+        ResultSink(results, results_dir).save_parquet()
+    elif fmt == "workbook":
+        os.makedirs(results_dir, exist_ok=True)
+        sink = ResultSink(results, results_dir)
+        for provider in sink.providers():
+            sink.provider_workbook(provider, os.path.join(results_dir, f"{provider}.xlsx"))
+    else:
+        raise ValueError(f"Unknown result format '{fmt}'. Choose from: {', '.join(FORMATS)}")
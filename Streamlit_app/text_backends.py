@@ -0,0 +1,113 @@
+import io
+import os
+import threading
+# Text extraction backends used by pdf_converter.py.
+# Each backend yields the plain text of every page in [start, stop), one
+# string per page, with lines separated by '\n'. The engines are imported
+# lazily so only the selected one has to be installed. A PDF is given either
+# as a file path or in memory (bytes, bytearray, memoryview or BytesIO, e.g.
+# straight from an upload), so nothing has to be written to disk first.
+default_backend = os.environ.get("PDF_CONVERTER_BACKEND", "pdfplumber")
+def pdf_input(source):
+    """A path unchanged, or the PDF's bytes (bytes objects are not copied)"""
+    if isinstance(source, (str, os.PathLike, bytes)):
+        return source
+    if isinstance(source, io.BytesIO):
+        return source.getvalue()
+    return bytes(source)
+def is_path(source):
+    return isinstance(source, (str, os.PathLike))
+# PDFium and MuPDF are not thread-safe, and the app converts in one
+# background thread per session: every pypdfium2 call in the process (text
+# extraction here, page rendering in pdf_viewer.py) must hold pdfium_lock,
+# every PyMuPDF call mupdf_lock. They are re-entrant, so a helper may take
+# one again while its caller holds it. pdfplumber keeps no shared state and
+# needs neither.
+pdfium_lock = threading.RLock()
+mupdf_lock = threading.RLock()
+# pdfplumber: layout-aware, the reference engine (slowest). Each page's
+# cached layout objects are released as soon as its text is extracted, so
+# memory does not grow with the page count of the open document.
+def pdfplumber_pages(pdf_path, start=0, stop=None):
+    import pdfplumber
+    # Only build Page objects for the requested range
+    page_numbers = list(range(start + 1, stop + 1)) if stop is not None else None
+    source = pdf_input(pdf_path)
+    # BytesIO over a bytes object shares its buffer instead of copying it
+    with pdfplumber.open(source if is_path(source) else io.BytesIO(source), pages=page_numbers) as pdf:
+        for page in (pdf.pages if page_numbers is not None else pdf.pages[start:]):
+            text = page.extract_text() or ""
+            page.close()
+            yield text
+def pdfplumber_page_count(pdf_path):
+    import pdfplumber
+    source = pdf_input(pdf_path)
+    with pdfplumber.open(source if is_path(source) else io.BytesIO(source)) as pdf:
+        return len(pdf.pages)
+# PyMuPDF: sort=True orders text blocks top-to-bottom, left-to-right so
+# table rows come out on one line like pdfplumber's output. Callers of
+# open_pymupdf hold mupdf_lock; the pages generator takes it per page.
+def open_pymupdf(pdf_path):
+    import fitz
+    source = pdf_input(pdf_path)
+    return fitz.open(source) if is_path(source) else fitz.open(stream=source, filetype="pdf")
+def pymupdf_pages(pdf_path, start=0, stop=None):
+    with mupdf_lock:
+        doc = open_pymupdf(pdf_path)
+        page_count = len(doc)
+    try:
+        for page_number in range(page_count)[start:stop]:
+            with mupdf_lock:
+                text = doc[page_number].get_text(sort=True)
+            yield text
+    finally:
+        with mupdf_lock:
+            doc.close()
+def pymupdf_page_count(pdf_path):
+    with mupdf_lock, open_pymupdf(pdf_path) as doc:
+        return len(doc)
+# pypdfium2: PDFium's text page, lines come back separated by '\r\n'.
+# The lock is taken per page, not across the yield, so other threads can
+# use PDFium between pages.
+def pypdfium2_pages(pdf_path, start=0, stop=None):
+    import pypdfium2 as pdfium
+    with pdfium_lock:
+        doc = pdfium.PdfDocument(pdf_input(pdf_path))
+        page_count = len(doc)
+    try:
+        for page_number in range(page_count)[start:stop]:
+            with pdfium_lock:
+                page = doc[page_number]
+                textpage = page.get_textpage()
+                text = textpage.get_text_bounded()
+                textpage.close()
+                page.close()
+            yield text.replace('\r\n', '\n').replace('\r', '\n')
+    finally:
+        with pdfium_lock:
+            doc.close()
+def pypdfium2_page_count(pdf_path):
+    import pypdfium2 as pdfium
+    with pdfium_lock:
+        doc = pdfium.PdfDocument(pdf_input(pdf_path))
+        try:
+            return len(doc)
+        finally:
+            doc.close()
+# Registry: backend name -> (page text generator, page counter)
+BACKENDS = {
+    "pdfplumber": (pdfplumber_pages, pdfplumber_page_count),
+    "pymupdf": (pymupdf_pages, pymupdf_page_count),
+    "pypdfium2": (pypdfium2_pages, pypdfium2_page_count),
+}
+def get_backend(name=None):
+    name = name or default_backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown text backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    return BACKENDS[name]
+def iter_page_texts(pdf_path, start=0, stop=None, backend=None):
+    pages, _ = get_backend(backend)
+    return pages(pdf_path, start, stop)
+def count_pages(pdf_path, backend=None):
+    _, page_count = get_backend(backend)
+    return page_count(pdf_path)
@@ -0,0 +1,109 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+# Per-session workspaces for the Streamlit app.
+# Every browser session gets its own directory under workspace_root holding
+# its input PDFs, Parquet store, attendance upload and Analyzed Results, so
+# concurrent users never share or wipe each other's files. Each script run,
+# and a running conversion job (see conversion_jobs.py), touches the
+# workspace's marker file; a background janitor thread removes
+# workspaces unused for longer than the TTL, then the least recently used
+# ones until the total fits the disk budget.
+workspace_root = os.environ.get("CARETAKER_WORKSPACE_ROOT", "workspaces")
+workspace_ttl_hours = float(os.environ.get("CARETAKER_WORKSPACE_TTL_HOURS", "12"))
+max_workspace_bytes = int(os.environ.get("CARETAKER_WORKSPACE_MAX_MB", "2048")) * 1024 * 1024
+janitor_interval_seconds = float(os.environ.get("CARETAKER_JANITOR_INTERVAL_SECONDS", "300"))
+MARKER = ".last_used"
+# Workspaces touched this recently are never evicted for disk budget
+ACTIVE_GRACE_SECONDS = 300
+_janitor = None
+_janitor_lock = threading.Lock()
+
+def create_workspace(root=None):
+    """Make a new empty workspace directory and return its path"""
+    path = os.path.join(root or workspace_root, uuid.uuid4().hex)
+    os.makedirs(path)
+    touch(path)
+    return path
+
+def touch(path):
+    """Mark a workspace as used now"""
+    with open(os.path.join(path, MARKER), "a"):
+        pass
+    os.utime(os.path.join(path, MARKER))
+
+def exists(path):
+    return os.path.isfile(os.path.join(path, MARKER))
+
+def last_used(path):
+    try:
+        return os.stat(os.path.join(path, MARKER)).st_mtime
+    except OSError:
+        return os.stat(path).st_mtime
+
+def workspace_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.stat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                continue
+    return total
+
+def evict_workspaces(root=None, ttl_hours=None, max_bytes=None):
+    """Remove expired workspaces, then the least recently used ones over the
+    disk budget; returns the removed paths"""
+    root = root or workspace_root
+    ttl_hours = workspace_ttl_hours if ttl_hours is None else ttl_hours
+    max_bytes = max_workspace_bytes if max_bytes is None else max_bytes
+    if not os.path.isdir(root):
+        return []
+    now = time.time()
+    removed = []
+    entries = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path):
+            continue
+        try:
+            used = last_used(path)
+        except OSError:
+            continue
+        if now - used > ttl_hours * 3600:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+        else:
+            entries.append((used, workspace_size(path), path))
+    total_bytes = sum(size for _, size, _ in entries)
+    for used, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        if now - used < ACTIVE_GRACE_SECONDS:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path)
+        total_bytes -= size
+    return removed
+
+def _janitor_loop(root, interval):
+    while True:
+        try:
+            for path in evict_workspaces(root):
+                print(f":broom: Removed workspace '{path}'")
+        except Exception as e:
+            print(f":warning: Workspace janitor failed: {e}")
+        time.sleep(interval)
+
+def start_janitor(root=None, interval=None):
+    """Start the process-wide janitor thread once"""
+    global _janitor
+    with _janitor_lock:
+        if _janitor is None or not _janitor.is_alive():
+            _janitor = threading.Thread(
+                target=_janitor_loop, args=(root or workspace_root, interval or janitor_interval_seconds),
+                name="workspace-janitor", daemon=True)
+            _janitor.start()
+    return _janitor